@@ -37,6 +37,8 @@ core_dependencies = [
 
 install_requires = core_dependencies + ['wheel']
 
+speedups_requires = ['orjson', 'msgpack']
+
 setup_requires = ['setuptools_scm']
 
 doc_requires = setup_requires + ['sphinx', 'sphinx-argparse', 'alabaster']
@@ -87,6 +89,7 @@ setup(
         'build': build_requires,
         'publish': publish_requires,
         'dev': build_requires,
+        'speedups': speedups_requires,
     },
     platforms='any',
     entry_points={
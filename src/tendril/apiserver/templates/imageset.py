@@ -1,10 +1,14 @@
 
 
+import io
 import os
 import uuid
 from typing import Dict
+from typing import List
 from typing import Union
 from typing import Optional
+from typing import Literal
+from pydantic import model_validator
 from pydantic.fields import Field
 from inflection import singularize
 from inflection import titleize
@@ -14,8 +18,15 @@ from fastapi import Request
 from fastapi import Depends
 from fastapi import File
 from fastapi import Body
+from fastapi import Query
+from fastapi import Header
 from fastapi import UploadFile
 from fastapi import BackgroundTasks
+from fastapi import Response
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
 
 from tendril.authn.users import auth_spec
 from tendril.authn.users import AuthUserModel
@@ -31,8 +42,38 @@ from tendril.caching.tokens import GenericTokenTModel
 
 from tendril.structures.content import content_models
 from tendril.config import IMAGESET_EXTENSIONS
+from tendril.config import IMAGESET_UPLOAD_MAX_SIZE
+from tendril.config import IMAGESET_UPLOAD_MAX_PIXELS
+from tendril.config import IMAGESET_RESUMABLE_UPLOAD_TTL
 from tendril.interests.mixins.imageset import InterestImageSetMixin
+from tendril.interests.mixins.imageset import read_imageset_contents
+from tendril.interests.mixins.imageset import read_imageset_timeline
+from tendril.db.models.imageset import ImageSetTModel
+from tendril.db.models.imageset import ImageSetContentTModel
+from tendril.db.models.imageset import ImageSetRevisionTModel
+from tendril.db.models.interests import InterestModel
+from tendril.common.interests.exceptions import InterestActionException
 from tendril.common.imageset.exceptions import FileTypeUnsupported
+from tendril.common.imageset.exceptions import FileContentMismatch
+from tendril.common.imageset.exceptions import ImageDimensionsExceeded
+from tendril.structures.imageset.sniff import sniff
+from tendril.structures.imageset.sniff import sniff_head
+from tendril.structures.imageset.sniff import multipart_boundary
+from tendril.structures.imageset.sniff import MultipartFileHead
+from tendril.structures.imageset.sniff import known_extensions
+from tendril.structures.imageset.sniff import normalize_extension
+from tendril.structures.imageset.spool import ResumableUpload
+from tendril.structures.imageset.spool import SpoolOffsetMismatch
+from tendril.structures.imageset.spool import SpoolSizeExceeded
+from tendril.structures.imageset.spool import SpoolFinalized
+from tendril.structures.imageset.threads import run_sync
+from tendril.structures.imageset.access import resolve_readable
+from tendril.structures.imageset.access import remember_readable
+from tendril.structures.imageset.workers import get_upload_queue
+from tendril.structures.imageset.workers import UploadQueueFull
+from tendril.structures.imageset.archive import stream_archive
+from tendril.structures.imageset.archive import archive_manifest
+from tendril.structures.imageset.archive import ARCHIVE_MEDIA_TYPES
 from tendril.db.models.content_formats import MediaContentFormatInfoTModel
 from tendril.db.models.content_formats import MediaContentFormatInfoFullTModel
 from tendril.db.models.content import MediaContentInfoTModel
@@ -41,14 +82,158 @@ from tendril.db.models.content import MediaContentInfoFullTModel
 from tendril.utils import log
 logger = log.get_logger(__name__)
 
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as ImageSetJSONResponse
+except ImportError:
+    ImageSetJSONResponse = JSONResponse
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = 'application/x-msgpack'
+
+# Allowance for the multipart envelope around the uploaded file itself.
+_MULTIPART_ALLOWANCE = 64 * 1024
+
+
+def _upload_too_large():
+    return HTTPException(status_code=413,
+                         detail=f"Imageset uploads are limited to {IMAGESET_UPLOAD_MAX_SIZE} bytes.")
+
+
+def _limited_receive(receive, limit):
+    received = 0
+
+    async def _receive():
+        nonlocal received
+        message = await receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > limit:
+                raise _upload_too_large()
+        return message
+    return _receive
+
+
+def _check_extension(file_ext, interest_id, interest_name):
+    # Ensure we accept the file extension
+    if file_ext not in IMAGESET_EXTENSIONS:
+        raise FileTypeUnsupported(file_ext, IMAGESET_EXTENSIONS,
+                                  'add_artefact', interest_id, interest_name)
+
+
+def _check_sniffed(sniffed, file_ext, interest_id, interest_name):
+    # Ensure the content actually looks like what the extension says
+    # it is, and that images are within the acceptable dimensions.
+    if sniffed['ext'] != normalize_extension(file_ext):
+        raise FileContentMismatch(file_ext, sniffed['ext'],
+                                  'add_artefact', interest_id, interest_name)
+    if sniffed['width'] and sniffed['height'] and \
+            sniffed['width'] * sniffed['height'] > IMAGESET_UPLOAD_MAX_PIXELS:
+        raise ImageDimensionsExceeded(sniffed['width'], sniffed['height'],
+                                      IMAGESET_UPLOAD_MAX_PIXELS,
+                                      'add_artefact', interest_id, interest_name)
+
+
+def _check_upload_head(interest_id, filename, head):
+    # The extension and content checks of the upload handler, made on the
+    # head of the file as it arrives, so that uploads which would fail them
+    # are refused before the rest of the body is received and spooled.
+    # The interest name is only filled in for uploads which are refused.
+    file_ext = os.path.splitext(filename)[1]
+    _check_extension(file_ext, interest_id, None)
+    if normalize_extension(file_ext) in known_extensions():
+        _check_sniffed(sniff_head(head), file_ext, interest_id, None)
+
+
+def _interest_name(interest_id):
+    with get_session() as session:
+        interest = session.get(InterestModel, interest_id)
+        return interest.name if interest else None
+
+
+def _sniffing_receive(receive, boundary, interest_id):
+    collector = MultipartFileHead(boundary)
+
+    async def _receive():
+        message = await receive()
+        if message['type'] == 'http.request' and not collector.done:
+            if collector.feed(message.get('body', b''), message.get('more_body', False)) \
+                    and collector.filename is not None:
+                try:
+                    _check_upload_head(interest_id, collector.filename, collector.head)
+                except InterestActionException as e:
+                    e.interest_name = await run_sync(_interest_name, interest_id)
+                    raise
+        return message
+    return _receive
+
+
+class ImageSetUploadRoute(APIRoute):
+    """
+    Route class for imageset uploads which rejects oversized requests from
+    the Content-Length header, and aborts requests without a usable length
+    as soon as the body received exceeds the limit, before it is spooled.
+    Multipart uploads are also aborted as soon as the head of the file shows
+    that it would fail the extension, content or pixel limit checks.
+    """
+    def get_route_handler(self):
+        handler = super(ImageSetUploadRoute, self).get_route_handler()
+        limit = IMAGESET_UPLOAD_MAX_SIZE + _MULTIPART_ALLOWANCE
+
+        async def _handler(request: Request):
+            content_length = request.headers.get('content-length')
+            if content_length:
+                try:
+                    content_length = int(content_length)
+                except ValueError:
+                    raise HTTPException(status_code=400,
+                                        detail=f"Invalid Content-Length header {content_length!r}.")
+                if content_length > limit:
+                    raise _upload_too_large()
+            receive = _limited_receive(request.receive, limit)
+            boundary = multipart_boundary(request.headers.get('content-type'))
+            # Requests with an invalid id are left for the handler to reject.
+            interest_id = request.path_params.get('id', '')
+            if boundary and interest_id.isdigit():
+                receive = _sniffing_receive(receive, boundary, int(interest_id))
+            request = Request(request.scope, receive)
+            return await handler(request)
+        return _handler
+
+
+def _if_match_version(if_match):
+    # Imageset ETags are the imageset version. Weak tags are accepted as
+    # well, since the version is all that is compared.
+    if not if_match or if_match.strip() == '*':
+        return None
+    tag = if_match.split(',')[0].strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=412,
+                            detail=f"Unrecognized If-Match value {if_match}.")
+
+
+def _set_etag(response, version):
+    if version is not None:
+        response.headers['ETag'] = f'"{version}"'
+
 
 class ImageSetDefaultDurationResponseTModel(TendrilTBaseModel):
     interest_id: int
+    version: int
     default_duration: int
 
 
 class ImageSetColorsResponseTModel(TendrilTBaseModel):
     interest_id: int
+    version: int
     bgcolor: Optional[str]
     color: Optional[str]
 
@@ -59,41 +244,191 @@ class ImageSetAddTModel(TendrilTBaseModel):
     duration: Optional[int]
 
 
+class ImageSetDurationsTModel(TendrilTBaseModel):
+    durations: Optional[Dict[int, Optional[int]]] = None
+    by: Literal['position', 'storedfile'] = 'position'
+    duration: Optional[int] = None
+    scale: Optional[float] = None
+
+    @model_validator(mode='after')
+    def _check_one_form(self):
+        forms = [x for x in (self.durations, self.duration, self.scale) if x is not None]
+        if len(forms) != 1:
+            raise ValueError("Expecting exactly one of durations, duration or scale")
+        return self
+
+
+class ImageSetRemoveTModel(TendrilTBaseModel):
+    positions: Optional[List[int]] = None
+    storedfile_ids: Optional[List[int]] = None
+    start: Optional[int] = None
+    end: Optional[int] = None
+    cleanup: bool = False
+
+
+class ImageSetRevisionCreateTModel(TendrilTBaseModel):
+    comment: Optional[str] = Field(None, max_length=255)
+
+
+class ImageSetResumableCreateTModel(TendrilTBaseModel):
+    filename: str
+    size: int
+
+
+class ImageSetResumableStatusTModel(TendrilTBaseModel):
+    token_id: str
+    offset: int
+    size: int
+
+
+class ImageSetContentsResponseTModel(ImageSetTModel):
+    interest_id: int
+    total_count: int
+    total_duration: int
+    next_after: Optional[int]
+
+
+class ImageSetAvailableItemTModel(TendrilTBaseModel):
+    storedfile_id: int
+    content: str
+    in_set: bool
+
+
+class ImageSetAvailableResponseTModel(TendrilTBaseModel):
+    interest_id: int
+    default_duration: int
+    contents: List[ImageSetAvailableItemTModel]
+    total_count: int
+    next_after: Optional[int]
+
+
+def _columnar(contents_response):
+    # Players generally want the contents as parallel arrays. This avoids
+    # repeating the keys for every item and is much smaller for large sets.
+    contents = contents_response.pop('contents')
+    contents_response['contents'] = {
+        k: [x[k] for x in contents] for k in ImageSetContentTModel.__fields__
+    }
+    return contents_response
+
+
+class ImageSetTimelineItemTModel(TendrilTBaseModel):
+    index: int
+    position: int
+    storedfile_id: int
+    start: int
+    remaining: float
+
+
+class ImageSetTimelineTModel(TendrilTBaseModel):
+    interest_id: int
+    version: int
+    total_duration: int
+    positions: List[int]
+    offsets: List[int]
+    durations: List[int]
+    current: Optional[ImageSetTimelineItemTModel] = None
+
+
+class ImageSetStoredFileReferenceTModel(TendrilTBaseModel):
+    imageset_id: int
+    position: int
+
+
 class InterestImageSetRouterGenerator(ApiRouterGenerator):
     def __init__(self, actual):
         super(InterestImageSetRouterGenerator, self).__init__()
         self._actual = actual
 
-    async def upload_imageset_content(self, request: Request,
-                                      id: int, background_tasks: BackgroundTasks,
+    @staticmethod
+    def _check_extension(interest, file_ext):
+        _check_extension(file_ext, interest.id, interest.name)
+
+    @staticmethod
+    def _check_content(interest, fileobj, file_ext):
+        if normalize_extension(file_ext) not in known_extensions():
+            return
+        _check_sniffed(sniff(fileobj), file_ext, interest.id, interest.name)
+
+    @staticmethod
+    def _storage_filename(file_name, file_ext):
+        # Confirm we have a valid UUIDv1 filename. If we don't, that probably means the
+        # frontend didn't do it's job, so we provide a random UUID instead.
+        try:
+            assert file_name[:3] == 'is_'
+            _ = uuid.UUID(file_name[3:], version=1)
+            return f'{file_name}{file_ext}'
+        except (ValueError, AssertionError):
+            # logger.warn(f"Got a non-compliant filename {file_name} from the frontend for an imageset "
+            #             "upload. Check frontend implementation. We want a UUIDv1 prefixed by 'is_'.")
+            return f"is_{uuid.uuid4()}{file_ext}"
+
+    @staticmethod
+    def _enqueue_upload(token_id, func, *args):
+        # The token records how many uploads were waiting when this one was
+        # queued, and how long it waited before processing started.
+        upload_queue = get_upload_queue()
+        tokens.update('isu', token_id, current="Queued",
+                      metadata={'queue_depth': upload_queue.depth})
+
+        def _on_start(wait):
+            tokens.update('isu', token_id, current="Processing",
+                          metadata={'queue_wait': round(wait, 3)})
+
+        try:
+            upload_queue.submit(func, *args, on_start=_on_start)
+        except UploadQueueFull as e:
+            tokens.update('isu', token_id, current="Upload Queue Full")
+            raise HTTPException(status_code=503, detail=str(e),
+                                headers={'Retry-After': str(e.retry_after)})
+
+    @staticmethod
+    def _detach_upload(file):
+        # The request's upload file is closed once the request is done. The
+        # queued job takes over the spooled file itself instead of a copy,
+        # and the request is left with an empty stand-in to close.
+        fileobj = file.file
+        file.file = io.BytesIO()
+        fileobj.seek(0)
+        return fileobj
+
+    def _process_upload(self, id, fileobj, filename, storage_filename, token_id, user):
+        try:
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                interest.upload_imageset_content(
+                    file=UploadFile(file=fileobj, filename=filename),
+                    rename_to=storage_filename,
+                    token_id=token_id, auth_user=user, session=session
+                )
+        finally:
+            fileobj.close()
+
+    async def upload_imageset_content(self, request: Request, id: int,
                                       file: UploadFile = File(...),
                                       user: AuthUserModel = auth_spec()):
+        """
+        Uploads are processed on a dedicated queue. The returned token tracks
+        the upload through the queue and processing. If the queue is full, a
+        503 is returned with a Retry-After header.
+        """
         # TODO We always allow this, since we don't enforce approvals on imagesets. This needs
         #    additional thought and possibly a way to inject approval requirements on a case
         #    by case basis.
+        return await run_sync(self._upload_imageset_content, id, file, user)
+
+    def _upload_imageset_content(self, id, file, user):
         with get_session() as session:
             interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
 
-            # Ensure we accept the file extension
             file_name, file_ext = os.path.splitext(file.filename)
-            if file_ext not in IMAGESET_EXTENSIONS:
-                raise FileTypeUnsupported(file_ext, IMAGESET_EXTENSIONS,
-                                          'add_artefact', interest.id, interest.name,)
+            self._check_extension(interest, file_ext)
+            self._check_content(interest, file.file, file_ext)
 
             # Get Auth clearance before sending the task to the background. This will
             # raise an exception if there is a problem.
             interest.upload_imageset_content(probe_only=True, auth_user=user, session=session)
-
-            # Confirm we have a valid UUIDv1 filename. If we don't, that probably means the
-            # frontend didn't do it's job, so we provide a random UUID instead.
-            try:
-                assert file_name[:3] == 'is_'
-                _ = uuid.UUID(file_name[3:], version=1)
-                storage_filename = f'{file_name}{file_ext}'
-            except (ValueError, AssertionError):
-                # logger.warn(f"Got a non-compliant filename {file_name} from the frontend for an imageset "
-                #             "upload. Check frontend implementation. We want a UUIDv1 prefixed by 'is_'.")
-                storage_filename = f"is_{uuid.uuid4()}{file_ext}"
+            storage_filename = self._storage_filename(file_name, file_ext)
 
             # The above prechecks are required at the API level here since we are delegating
             # to a background task, and we want to avoid forcing the client to deal with
@@ -111,12 +446,14 @@ class InterestImageSetRouterGenerator(ApiRouterGenerator):
                 progress_max=1, ttl=600,
             )
 
-            background_tasks.add_task(interest.upload_imageset_content,
-                                      file=file,
-                                      rename_to=storage_filename,
-                                      token_id=upload_token.id,
-                                      auth_user=user, session=session)
-
+        fileobj = self._detach_upload(file)
+        try:
+            self._enqueue_upload(upload_token.id, self._process_upload, id, fileobj,
+                                 file.filename, storage_filename, upload_token.id, user)
+        except HTTPException:
+            fileobj.close()
+            tokens.close('isu', upload_token.id, failed=True)
+            raise
         return upload_token
     #
     # async def format_info(self, request: Request, id: int, format_id: int,
@@ -143,17 +480,164 @@ class InterestImageSetRouterGenerator(ApiRouterGenerator):
     #         interest: MediaContentInterest = self._actual.item(id=id, session=session)
     #         return interest.generate_from_provider(provider_id, args=args, auth_user=user, session=session)
 
+    """
+    Resumable uploads are created with the file name and size, after which
+    the file is sent in chunks, each with the offset at which it starts. The
+    chunks are spooled locally and progress is recorded in the upload token.
+    If the connection fails, the client can get the offset already received
+    and resend only the rest. Once all the bytes have been received, the
+    upload is finalized and processed just like a single-shot upload.
+    """
+    @staticmethod
+    def _resumable_metadata(upload, offset):
+        return {'interest_id': upload.meta['interest_id'],
+                'filename': upload.meta['storage_filename'],
+                'resumable': True,
+                'size': upload.meta['size'],
+                'offset': offset}
+
+    @staticmethod
+    def _resumable_status(upload, token_id, offset=None):
+        return {'token_id': token_id,
+                'offset': upload.offset if offset is None else offset,
+                'size': upload.meta['size']}
+
+    @staticmethod
+    def _get_resumable(interest_id, token_id, user):
+        try:
+            upload = ResumableUpload(token_id)
+        except ValueError:
+            upload = None
+        if not upload or not upload.exists() or \
+                upload.meta['interest_id'] != interest_id or \
+                upload.meta['user_id'] != user.id:
+            raise HTTPException(status_code=404,
+                                detail=f"No resumable imageset upload {token_id} "
+                                       f"found for interest {interest_id}.")
+        return upload
+
+    def _process_resumable(self, id, upload, token_id, user):
+        try:
+            self._process_upload(id, upload.open(), upload.meta['filename'],
+                                 upload.meta['storage_filename'], token_id, user)
+        finally:
+            upload.release()
+
+    async def create_resumable_upload(self, request: Request, id: int,
+                                      spec: ImageSetResumableCreateTModel,
+                                      user: AuthUserModel = auth_spec()):
+        if spec.size > IMAGESET_UPLOAD_MAX_SIZE:
+            raise _upload_too_large()
+        return await run_sync(self._create_resumable_upload, id, spec, user)
+
+    def _create_resumable_upload(self, id, spec, user):
+        with get_session() as session:
+            interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+            file_name, file_ext = os.path.splitext(spec.filename)
+            self._check_extension(interest, file_ext)
+            interest.upload_imageset_content(probe_only=True, auth_user=user, session=session)
+            storage_filename = self._storage_filename(file_name, file_ext)
+
+            upload_token = tokens.open(
+                namespace='isu',
+                metadata={'interest_id': interest.id,
+                          'filename': storage_filename,
+                          'resumable': True,
+                          'size': spec.size,
+                          'offset': 0},
+                user=user.id, current="Awaiting Upload",
+                progress_max=1, ttl=IMAGESET_RESUMABLE_UPLOAD_TTL,
+            )
+            ResumableUpload.create(upload_token.id, interest_id=interest.id, user_id=user.id,
+                                   filename=spec.filename, storage_filename=storage_filename,
+                                   size=spec.size)
+        return upload_token
+
+    async def upload_resumable_chunk(self, request: Request, id: int, token_id: str,
+                                     offset: int = Query(..., ge=0),
+                                     user: AuthUserModel = auth_spec()):
+        upload = await run_sync(self._get_resumable, id, token_id, user)
+        try:
+            offset = await upload.write(offset, request.stream())
+        except SpoolOffsetMismatch as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except SpoolSizeExceeded as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except SpoolFinalized as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        await run_sync(tokens.update, 'isu', token_id, current="Receiving File",
+                       metadata=self._resumable_metadata(upload, offset))
+        return self._resumable_status(upload, token_id, offset)
+
+    async def get_resumable_status(self, request: Request, id: int, token_id: str,
+                                   user: AuthUserModel = auth_spec()):
+        def _get_status():
+            upload = self._get_resumable(id, token_id, user)
+            return self._resumable_status(upload, token_id)
+        return await run_sync(_get_status)
+
+    async def finalize_resumable_upload(self, request: Request, id: int, token_id: str,
+                                        user: AuthUserModel = auth_spec()):
+        """
+        Finalizing is idempotent. Once an upload has been finalized, it
+        accepts no further chunks, and finalizing it again returns its status
+        without processing it a second time. Progress is tracked by the token.
+        If the upload queue is full, the received upload is kept and can be
+        finalized again after the Retry-After interval.
+        """
+        return await run_sync(self._finalize_resumable_upload, id, token_id, user)
+
+    def _finalize_resumable_upload(self, id, token_id, user):
+        upload = self._get_resumable(id, token_id, user)
+        if upload.finalized:
+            return self._resumable_status(upload, token_id)
+        if not upload.complete:
+            raise HTTPException(status_code=409,
+                                detail=f"Upload is incomplete. Received {upload.offset} "
+                                       f"of {upload.meta['size']} bytes.")
+        if not upload.finalize():
+            # Finalized by a concurrent request.
+            return self._resumable_status(upload, token_id)
+        try:
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                _, file_ext = os.path.splitext(upload.meta['filename'])
+                try:
+                    with upload.open() as f:
+                        self._check_content(interest, f, file_ext)
+                except Exception:
+                    upload.discard()
+                    raise
+                interest.upload_imageset_content(probe_only=True, auth_user=user, session=session)
+
+                tokens.update('isu', token_id, current="Request Created",
+                              metadata=self._resumable_metadata(upload, upload.offset))
+            self._enqueue_upload(token_id, self._process_resumable, id, upload, token_id, user)
+        except Exception:
+            upload.reopen()
+            raise
+        return self._resumable_status(upload, token_id)
+
     """
     This won't have any effect for most interests. Only in those cases where the imageset is  
     core to the interest's reason for existing, where display of the imageset has a specialized 
     interface will this matter.
     """
-    async def set_imageset_default_duration(self, request:Request, id: int,
+    async def set_imageset_default_duration(self, request:Request, response: Response, id: int,
                                             duration: int = 10,
+                                            if_match: Optional[str] = Header(None),
                                             user: AuthUserModel = auth_spec()):
-        with get_session() as session:
-            interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
-            return interest.imageset_set_default_duration(default_duration=duration, auth_user=user, session=session)
+        expected_version = _if_match_version(if_match)
+
+        def _set_default_duration():
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                return interest.imageset_set_default_duration(default_duration=duration,
+                                                              expected_version=expected_version,
+                                                              auth_user=user, session=session)
+        rv = await run_sync(_set_default_duration)
+        _set_etag(response, rv['version'])
+        return rv
 
     """
     This won't have any effect for most interests. 
@@ -166,50 +650,306 @@ class InterestImageSetRouterGenerator(ApiRouterGenerator):
     color combination alongside the imageset itself to provide some scaffolding for branding
     on a per-interest basis.
     """
-    async def set_imageset_colors(self, request: Request, id: int,
+    async def set_imageset_colors(self, request: Request, response: Response, id: int,
                                   bgcolor: str = None,
                                   color: str = None,
+                                  if_match: Optional[str] = Header(None),
                                   user: AuthUserModel = auth_spec()):
+        expected_version = _if_match_version(if_match)
+
+        def _set_colors():
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                return interest.imageset_set_colors(bgcolor=bgcolor, color=color,
+                                                    expected_version=expected_version,
+                                                    auth_user=user, session=session)
+        rv = await run_sync(_set_colors)
+        _set_etag(response, rv['version'])
+        return rv
+
+    def _get_contents(self, id, user, **kwargs):
         with get_session() as session:
+            # Polled reads skip building the interest once its state and the
+            # user's read access are known. See structures.imageset.access.
+            imageset_id = resolve_readable(id, user.id)
+            if imageset_id is not None:
+                return read_imageset_contents(id, imageset_id, session=session, **kwargs)
             interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
-            return interest.imageset_set_colors(bgcolor=bgcolor, color=color, auth_user=user, session=session)
+            rv = interest.imageset_get_contents(auth_user=user, session=session, **kwargs)
+            remember_readable(interest, user.id)
+            return rv
+
+    async def _get_contents_response(self, response, id, user):
+        rv = await run_sync(self._get_contents, id, user)
+        _set_etag(response, rv['version'])
+        return rv
 
-    async def get_imageset_contents(self, request: Request, id: int,
+    async def get_imageset_contents(self, request: Request, response: Response, id: int,
+                                    offset: int = Query(None, ge=0),
+                                    limit: int = Query(None, ge=1),
+                                    after: int = Query(None, ge=-1),
+                                    compact: bool = False,
                                     user: AuthUserModel = auth_spec()):
-        with get_session() as session:
-            interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
-            return interest.imageset_get_contents(auth_user=user, session=session)
+        """
+        Without any of the windowing parameters, the full imageset is returned.
+        Otherwise, only the requested window of contents is returned, either by
+        offset and limit or after a position cursor. Use the returned
+        ``next_after`` as the ``after`` cursor to fetch the next window.
+
+        With ``compact``, contents are returned as columnar arrays instead of a
+        list of objects. Clients sending ``Accept: application/x-msgpack`` get
+        the columnar form encoded as msgpack, if msgpack is available.
+
+        The ETag of the response is the imageset version, which can be used
+        with If-Match on subsequent changes to the imageset.
+        """
+        rv = await run_sync(self._get_contents, id, user,
+                            offset=offset, limit=limit, after=after)
+
+        if msgpack and MSGPACK_MEDIA_TYPE in request.headers.get('accept', ''):
+            response = Response(msgpack.packb(_columnar(rv)), media_type=MSGPACK_MEDIA_TYPE)
+        elif compact:
+            response = ImageSetJSONResponse(_columnar(rv))
+        else:
+            _set_etag(response, rv['version'])
+            response.headers['Vary'] = 'Accept'
+            return rv
+        _set_etag(response, rv['version'])
+        # The encoding depends on Accept, so caches must not mix them up.
+        response.headers['Vary'] = 'Accept'
+        return response
+
+    async def get_available_contents(self, request: Request, id: int,
+                                     offset: int = Query(None, ge=0),
+                                     limit: int = Query(None, ge=1),
+                                     after: int = Query(None, ge=0),
+                                     user: AuthUserModel = auth_spec()):
+        """
+        Lists the imageset files uploaded to the interest, including those not
+        presently in the imageset, ordered by storedfile id. ``in_set`` marks
+        the files which are in the imageset. Windowing works as it does for
+        the imageset contents, with ``next_after`` being a storedfile id.
+        """
+        def _get_available():
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                return interest.imageset_get_available_contents(offset=offset, limit=limit, after=after,
+                                                                auth_user=user, session=session)
+        return await run_sync(_get_available)
+
+    async def get_imageset_timeline(self, request: Request, id: int,
+                                    t: float = None,
+                                    user: AuthUserModel = auth_spec()):
+        """
+        Returns the playback timeline of the imageset, with the start offset of
+        each item within the loop. If ``t`` is provided, also returns the item
+        showing at ``t`` seconds into the loop and the time it has remaining.
+        Wall-clock timestamps may be used for ``t`` directly.
+        """
+        def _get_timeline():
+            with get_session() as session:
+                imageset_id = resolve_readable(id, user.id)
+                if imageset_id is not None:
+                    return read_imageset_timeline(id, imageset_id, t=t, session=session)
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                rv = interest.imageset_get_timeline(t=t, auth_user=user, session=session)
+                remember_readable(interest, user.id)
+                return rv
+        return await run_sync(_get_timeline)
 
-    async def add_to_imageset(self, request:Request, id:int, item: ImageSetAddTModel,
+    async def get_storedfile_usage(self, request: Request, id: int,
+                                   storedfile_id: List[int] = Query(...),
+                                   user: AuthUserModel = auth_spec()):
+        """
+        Lists the positions at which each of the interest's StoredFiles is
+        used in the interest's imageset. Usage in other interests' imagesets
+        is not reported.
+        """
+        def _get_usage():
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                return interest.imageset_storedfile_usage(storedfile_id, auth_user=user, session=session)
+        return await run_sync(_get_usage)
+
+    async def get_imageset_archive(self, request: Request, id: int,
+                                   format: Literal['zip', 'tar'] = 'zip',
+                                   user: AuthUserModel = auth_spec()):
+        """
+        Streams an archive of all the files in the imageset, along with a
+        ``manifest.json`` describing the imageset and naming the file for
+        each item in playback order. Files are read from the filestore as
+        the archive is written, so the response starts right away and is
+        never assembled in full on the server.
+        """
+        rv = await run_sync(self._get_contents, id, user)
+        manifest, entries = archive_manifest(rv)
+        filename = f"imageset-{rv['interest_id']}-v{rv['version']}.{format}"
+        response = StreamingResponse(stream_archive(entries, manifest, format=format),
+                                     media_type=ARCHIVE_MEDIA_TYPES[format],
+                                     headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+        _set_etag(response, rv['version'])
+        return response
+
+    async def add_to_imageset(self, request:Request, response: Response, id:int, item: ImageSetAddTModel,
+                              if_match: Optional[str] = Header(None),
                               user: AuthUserModel = auth_spec()):
-        with get_session() as session:
-            interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
-            result = interest.imageset_add(**item.dict(), auth_user=user, session=session)
+        expected_version = _if_match_version(if_match)
+
+        def _add():
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                return interest.imageset_add(**item.dict(), expected_version=expected_version,
+                                             auth_user=user, session=session)
+        result = await run_sync(_add)
 
         if not result:
             raise Exception
 
-        with get_session() as session:
-            interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
-            return interest.imageset_get_contents(auth_user=user, session=session)
+        return await self._get_contents_response(response, id, user)
 
-    async def remove_from_imageset(self, request:Request, id: int, position: int,
+    async def remove_from_imageset(self, request:Request, response: Response, id: int, position: int,
+                                   if_match: Optional[str] = Header(None),
                                    user: AuthUserModel = auth_spec()):
-        with get_session() as session:
-            interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
-            result = interest.imageset_remove(position=position, auth_user=user, session=session)
+        expected_version = _if_match_version(if_match)
+
+        def _remove():
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                return interest.imageset_remove(position=position, expected_version=expected_version,
+                                                auth_user=user, session=session)
+        result = await run_sync(_remove)
 
         if not result:
             raise Exception
 
-        with get_session() as session:
-            interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
-            return interest.imageset_get_contents(auth_user=user, session=session)
+        return await self._get_contents_response(response, id, user)
+
+    async def remove_many_from_imageset(self, request: Request, response: Response, id: int,
+                                        spec: ImageSetRemoveTModel,
+                                        background_tasks: BackgroundTasks,
+                                        if_match: Optional[str] = Header(None),
+                                        user: AuthUserModel = auth_spec()):
+        """
+        Remove every item matching all of the provided criteria : a list of
+        positions, a list of storedfile ids, and / or a range of positions
+        from ``start`` (inclusive) to ``end`` (exclusive). Positions are
+        compacted once afterwards. With ``cleanup``, the removed files are
+        deleted from the filestore in the background if nothing else
+        references them.
+        """
+        expected_version = _if_match_version(if_match)
+
+        def _remove_many():
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                return interest.imageset_remove_many(**spec.dict(), expected_version=expected_version,
+                                                     background_tasks=background_tasks,
+                                                     auth_user=user, session=session)
+        await run_sync(_remove_many)
+        return await self._get_contents_response(response, id, user)
+
+    async def clone_imageset(self, request: Request, response: Response, id: int, source_id: int,
+                             background_tasks: BackgroundTasks,
+                             if_match: Optional[str] = Header(None),
+                             user: AuthUserModel = auth_spec()):
+        if source_id == id:
+            raise HTTPException(status_code=400,
+                                detail="Cannot clone an imageset into itself.")
+        expected_version = _if_match_version(if_match)
+
+        def _clone():
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                source: InterestImageSetMixin = self._actual.item(id=source_id, session=session)
+                return interest.imageset_clone_from(source, expected_version=expected_version,
+                                                    background_tasks=background_tasks,
+                                                    auth_user=user, session=session)
+        result = await run_sync(_clone)
+
+        if not result:
+            raise Exception
 
-    async def change_item_duration(self, request:Request, id:int,
+        return await self._get_contents_response(response, id, user)
+
+    async def get_imageset_revisions(self, request: Request, id: int,
+                                     user: AuthUserModel = auth_spec()):
+        def _get_revisions():
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                return interest.imageset_get_revisions(auth_user=user, session=session)
+        return await run_sync(_get_revisions)
+
+    async def create_imageset_revision(self, request: Request, id: int,
+                                       spec: ImageSetRevisionCreateTModel,
+                                       user: AuthUserModel = auth_spec()):
+        """
+        Snapshot the imageset as it is now. If the imageset has not changed
+        since its latest revision, that revision is returned instead.
+        Revisions are also taken automatically when the interest is activated.
+        """
+        def _create_revision():
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                return interest.imageset_create_revision(comment=spec.comment,
+                                                         auth_user=user, session=session)
+        return await run_sync(_create_revision)
+
+    async def restore_imageset_revision(self, request: Request, response: Response,
+                                        id: int, revision_id: int,
+                                        background_tasks: BackgroundTasks,
+                                        if_match: Optional[str] = Header(None),
+                                        user: AuthUserModel = auth_spec()):
+        """
+        Replace the contents, durations and colors of the imageset with those
+        of the revision, in a single transaction. The restore is itself a
+        change, and gets a new imageset version.
+        """
+        expected_version = _if_match_version(if_match)
+
+        def _restore():
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                return interest.imageset_restore_revision(revision_id=revision_id,
+                                                          expected_version=expected_version,
+                                                          background_tasks=background_tasks,
+                                                          auth_user=user, session=session)
+        await run_sync(_restore)
+        return await self._get_contents_response(response, id, user)
+
+    async def set_item_durations(self, request: Request, response: Response, id: int,
+                                 spec: ImageSetDurationsTModel,
+                                 if_match: Optional[str] = Header(None),
+                                 user: AuthUserModel = auth_spec()):
+        """
+        Change the durations of imageset items in one operation. Provide one of :
+
+          - ``durations``, a mapping of positions (or storedfile ids, with
+            ``by`` set to ``storedfile``) to durations. A null duration resets
+            the item to the imageset default duration.
+          - ``duration``, to apply a single duration to every item.
+          - ``scale``, to scale the duration of every item by a factor.
+        """
+        expected_version = _if_match_version(if_match)
+
+        def _set_durations():
+            with get_session() as session:
+                interest: InterestImageSetMixin = self._actual.item(id=id, session=session)
+                return interest.imageset_set_item_durations(**spec.dict(), expected_version=expected_version,
+                                                            auth_user=user, session=session)
+        result = await run_sync(_set_durations)
+
+        if not result:
+            raise Exception
+
+        return await self._get_contents_response(response, id, user)
+
+    async def change_item_duration(self, request:Request, response: Response, id:int,
                                    position:int, duration:int,
+                                   if_match: Optional[str] = Header(None),
                                    user: AuthUserModel = auth_spec()):
-        pass
+        spec = ImageSetDurationsTModel(durations={position: duration})
+        return await self.set_item_durations(request, response, id, spec,
+                                             if_match=if_match, user=user)
 
     def generate(self, name):
         desc = f'ImageSet API for {titleize(singularize(name))} Interests'
@@ -219,6 +959,24 @@ class InterestImageSetRouterGenerator(ApiRouterGenerator):
 
         router.add_api_route("/{id}/imageset/upload", self.upload_imageset_content, methods=["POST"],
                              response_model=GenericTokenTModel,
+                             route_class_override=ImageSetUploadRoute,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
+
+        router.add_api_route("/{id}/imageset/upload/resumable", self.create_resumable_upload, methods=["POST"],
+                             response_model=GenericTokenTModel,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
+
+        router.add_api_route("/{id}/imageset/upload/resumable/{token_id}", self.upload_resumable_chunk,
+                             methods=["PUT"], response_model=ImageSetResumableStatusTModel,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
+
+        router.add_api_route("/{id}/imageset/upload/resumable/{token_id}", self.get_resumable_status,
+                             methods=["GET"], response_model=ImageSetResumableStatusTModel,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
+
+        router.add_api_route("/{id}/imageset/upload/resumable/{token_id}/finalize",
+                             self.finalize_resumable_upload, methods=["POST"],
+                             response_model=ImageSetResumableStatusTModel,
                              dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
 
         # router.add_api_route("/{id}/imageset/delete", self.delete_imageset_content, methods=["POST"],
@@ -234,15 +992,71 @@ class InterestImageSetRouterGenerator(ApiRouterGenerator):
                              dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
 
         router.add_api_route("/{id}/imageset", self.get_imageset_contents, methods=['GET'],
-                             # response_model=,
+                             response_model=ImageSetContentsResponseTModel,
+                             response_class=ImageSetJSONResponse,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:read'])])
+
+        router.add_api_route("/{id}/imageset/available", self.get_available_contents, methods=['GET'],
+                             response_model=ImageSetAvailableResponseTModel,
+                             response_class=ImageSetJSONResponse,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:read'])])
+
+        router.add_api_route("/{id}/imageset/timeline", self.get_imageset_timeline, methods=['GET'],
+                             response_model=ImageSetTimelineTModel,
+                             response_class=ImageSetJSONResponse,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:read'])])
+
+        router.add_api_route("/{id}/imageset/usage", self.get_storedfile_usage, methods=['GET'],
+                             response_model=Dict[int, List[ImageSetStoredFileReferenceTModel]],
+                             dependencies=[auth_spec(scopes=[f'{prefix}:read'])])
+
+        router.add_api_route("/{id}/imageset/archive", self.get_imageset_archive, methods=['GET'],
+                             response_class=StreamingResponse,
                              dependencies=[auth_spec(scopes=[f'{prefix}:read'])])
 
         router.add_api_route("/{id}/imageset/add", self.add_to_imageset, methods=['POST'],
-                            # response_model=,
+                             response_model=ImageSetContentsResponseTModel,
+                             response_class=ImageSetJSONResponse,
                              dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
 
         router.add_api_route("/{id}/imageset/remove/{position}", self.remove_from_imageset, methods=['POST'],
-                             # response_model=,
+                             response_model=ImageSetContentsResponseTModel,
+                             response_class=ImageSetJSONResponse,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
+
+        router.add_api_route("/{id}/imageset/remove", self.remove_many_from_imageset, methods=['POST'],
+                             response_model=ImageSetContentsResponseTModel,
+                             response_class=ImageSetJSONResponse,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
+
+        router.add_api_route("/{id}/imageset/durations", self.set_item_durations, methods=['POST'],
+                             response_model=ImageSetContentsResponseTModel,
+                             response_class=ImageSetJSONResponse,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
+
+        router.add_api_route("/{id}/imageset/item/{position}/duration", self.change_item_duration,
+                             methods=['POST'],
+                             response_model=ImageSetContentsResponseTModel,
+                             response_class=ImageSetJSONResponse,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
+
+        router.add_api_route("/{id}/imageset/revisions", self.get_imageset_revisions, methods=['GET'],
+                             response_model=List[ImageSetRevisionTModel],
+                             dependencies=[auth_spec(scopes=[f'{prefix}:read'])])
+
+        router.add_api_route("/{id}/imageset/revisions", self.create_imageset_revision, methods=['POST'],
+                             response_model=ImageSetRevisionTModel,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
+
+        router.add_api_route("/{id}/imageset/revisions/{revision_id}/restore",
+                             self.restore_imageset_revision, methods=['POST'],
+                             response_model=ImageSetContentsResponseTModel,
+                             response_class=ImageSetJSONResponse,
+                             dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
+
+        router.add_api_route("/{id}/imageset/clone", self.clone_imageset, methods=['POST'],
+                             response_model=ImageSetContentsResponseTModel,
+                             response_class=ImageSetJSONResponse,
                              dependencies=[auth_spec(scopes=[f'{prefix}:write'])])
 
         return [router]
@@ -28,3 +28,45 @@ class FileTypeUnsupported(InterestActionException):
         return f"Imageset content upload to interest {self.interest_id}, {self.interest_name} " \
                f"failed. Provided file has extension '{self.extension}' which is unsupported. " \
                f"Supported extensions are `{self.allowed}`."
+
+
+class ImageSetVersionConflict(InterestActionException):
+    status_code = 412
+
+    def __init__(self, expected, *args, **kwargs):
+        super(ImageSetVersionConflict, self).__init__(*args, **kwargs)
+        self.expected = expected
+
+    def __str__(self):
+        return f"The imageset of interest {self.interest_id}, {self.interest_name} has " \
+               f"changed since version {self.expected}. '{self.action}' was not performed. " \
+               f"Fetch the imageset again and retry."
+
+
+class FileContentMismatch(InterestActionException):
+    status_code = 406
+
+    def __init__(self, extension, detected, *args, **kwargs):
+        super(FileContentMismatch, self).__init__(*args, **kwargs)
+        self.extension = extension
+        self.detected = detected
+
+    def __str__(self):
+        return f"Imageset content upload to interest {self.interest_id}, {self.interest_name} " \
+               f"failed. Provided file has extension '{self.extension}' but its content " \
+               f"looks like '{self.detected or 'unknown'}'."
+
+
+class ImageDimensionsExceeded(InterestActionException):
+    status_code = 413
+
+    def __init__(self, width, height, max_pixels, *args, **kwargs):
+        super(ImageDimensionsExceeded, self).__init__(*args, **kwargs)
+        self.width = width
+        self.height = height
+        self.max_pixels = max_pixels
+
+    def __str__(self):
+        return f"Imageset content upload to interest {self.interest_id}, {self.interest_name} " \
+               f"failed. Provided image is {self.width}x{self.height}, which exceeds the " \
+               f"maximum of {self.max_pixels} pixels."
@@ -50,6 +50,70 @@ config_elements_imageset = [
         "IMAGESET_IMAGE_EXTENSIONS + IMAGESET_DOCUMENT_EXTENSIONS + IMAGESET_EXTRA_EXTENSIONS",
         "List of recognized extensions for imageset files"
     ),
+    ConfigOption(
+        'IMAGESET_UPLOAD_MAX_SIZE',
+        "50 * 1024 * 1024",
+        "Maximum size, in bytes, of a single imageset file upload. Uploads "
+        "exceeding this are aborted while they are still being received."
+    ),
+    ConfigOption(
+        'IMAGESET_UPLOAD_MAX_PIXELS',
+        "100 * 1000 * 1000",
+        "Maximum number of pixels (width x height) of an uploaded imageset image."
+    ),
+    ConfigOption(
+        'IMAGESET_UPLOAD_SPOOL_DIR',
+        "os.path.join(INSTANCE_CACHE, 'imageset', 'spool')",
+        "Local folder in which partially received resumable imageset uploads are "
+        "spooled. This should be on a filesystem shared by all API workers."
+    ),
+    ConfigOption(
+        'IMAGESET_RESUMABLE_UPLOAD_TTL',
+        "24 * 60 * 60",
+        "Time, in seconds, for which an idle resumable imageset upload is retained "
+        "before it is discarded."
+    ),
+    ConfigOption(
+        'IMAGESET_TOKEN_UPDATE_WINDOW',
+        "1.0",
+        "Time window, in seconds, within which progress updates to imageset upload "
+        "tokens are merged into a single write. State changes and failures are "
+        "always written immediately."
+    ),
+    ConfigOption(
+        'IMAGESET_DB_THREADPOOL_SIZE',
+        "16",
+        "Maximum number of worker threads used concurrently by the imageset API "
+        "to run synchronous database and interest operations off the event loop."
+    ),
+    ConfigOption(
+        'IMAGESET_UPLOAD_WORKERS',
+        "4",
+        "Number of dedicated worker threads which process imageset uploads "
+        "once they have been received."
+    ),
+    ConfigOption(
+        'IMAGESET_UPLOAD_QUEUE_DEPTH',
+        "100",
+        "Maximum number of received imageset uploads waiting to be processed. "
+        "Further uploads are refused with a 503 and a Retry-After header until "
+        "the backlog drains."
+    ),
+    ConfigOption(
+        'IMAGESET_ACCESS_CACHE_TTL',
+        "30",
+        "Seconds for which the imageset, lifecycle state and read access of an "
+        "interest are cached for the read-only imageset routes. Lifecycle and "
+        "membership changes made through this process are applied immediately. "
+        "Changes made by other processes, and membership changes inherited from "
+        "parent interests, take effect once this expires."
+    ),
+    ConfigOption(
+        'IMAGESET_ACCESS_CACHE_SIZE',
+        "4096",
+        "Maximum number of interests and of user read permissions held in the "
+        "imageset access caches."
+    ),
     ConfigOption(
         'IMAGESET_UPLOAD_FILESTORE_BUCKET',
         '"incoming"',
@@ -62,6 +126,57 @@ config_elements_imageset = [
         "The filestore bucket in which published imageset files are to be written. Note that "
         "filestore will not have this bucket by default. You must create it or choose one "
         "that exists."
+    ),
+    ConfigOption(
+        'IMAGESET_PUBLISH_CONCURRENCY',
+        "8",
+        "Maximum number of concurrent move requests issued to the filestore "
+        "when publishing imageset files."
+    ),
+    ConfigOption(
+        'IMAGESET_GC_BATCH_SIZE',
+        "100",
+        "Number of orphaned imageset files to fetch and process together "
+        "when collecting garbage from the filestore."
+    ),
+    ConfigOption(
+        'IMAGESET_GC_CONCURRENCY',
+        "4",
+        "Maximum number of concurrent filestore delete requests issued "
+        "while collecting orphaned imageset files."
+    ),
+    ConfigOption(
+        'IMAGESET_GC_RATE_LIMIT',
+        "10",
+        "Maximum number of orphaned imageset files to delete per second. "
+        "Set to 0 to disable rate limiting."
+    ),
+    ConfigOption(
+        'IMAGESET_GC_GRACE_PERIOD',
+        "3600",
+        "Minimum age, in seconds, of an unreferenced imageset file before it "
+        "is considered orphaned. This protects files which have been uploaded "
+        "but not yet linked to an imageset."
+    ),
+    ConfigOption(
+        'IMAGESET_REVISION_RETENTION',
+        "20",
+        "Number of the most recent revisions kept for each imageset. Older "
+        "revisions are pruned whenever a new one is taken. Files referenced "
+        "by a kept revision are never collected as orphans, so this also "
+        "bounds how long replaced files are retained. 0 keeps every revision."
+    ),
+    ConfigOption(
+        'IMAGESET_ARCHIVE_PREFETCH',
+        "4",
+        "Number of imageset files fetched ahead of the writer when streaming an "
+        "imageset archive. Memory use is bounded by this many files in flight."
+    ),
+    ConfigOption(
+        'IMAGESET_ARCHIVE_FETCH_TIMEOUT',
+        "60",
+        "Timeout, in seconds, for fetching each imageset file from the filestore "
+        "when streaming an imageset archive."
     )
 ]
 
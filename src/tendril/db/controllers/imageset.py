@@ -1,10 +1,35 @@
 
 
+from datetime import datetime
+from datetime import timedelta
+from sqlalchemy import func
+from sqlalchemy import and_
+from sqlalchemy import case
+from sqlalchemy import cast
+from sqlalchemy import column
+from sqlalchemy import update
+from sqlalchemy import delete
+from sqlalchemy import values
+from sqlalchemy import Integer
+from sqlalchemy import exists
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy import literal
 from sqlalchemy.exc import NoResultFound
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import load_only
 
 from tendril.db.models.imageset import ImageSetModel
 from tendril.db.models.imageset import ImageSetAssociationModel
+from tendril.db.models.imageset import ImageSetRevisionModel
+from tendril.db.models.imageset import ImageSetRevisionItemModel
+from tendril.db.models.imageset import MEDIA_COLUMNS
+from tendril.filestore.db.model import StoredFileModel
+from tendril.authn.db.model import UserModel
+from tendril.db.models.interests import InterestModel
 
+from tendril.config import IMAGESET_PUBLISHING_FILESTORE_BUCKET
+from tendril.config import IMAGESET_REVISION_RETENTION
 from tendril.utils.db import with_db
 
 
@@ -35,46 +60,150 @@ def create_imageset(id=None, session=None, **kwargs):
     session.flush()
     return imageset
 
+
+@with_db
+def imageset_storedfile_references(storedfile_ids, interest_id=None, imageset_ids=None, session=None):
+    # Returns the imageset positions at which each of the StoredFiles is
+    # used. With interest_id, only StoredFiles belonging to that interest
+    # are included, and with imageset_ids, only usage within those imagesets
+    # is reported. Excluded StoredFiles are absent from the result, while
+    # included ones which are not used map to an empty list.
+    if isinstance(storedfile_ids, int):
+        storedfile_ids = [storedfile_ids]
+    usage = [ImageSetAssociationModel.storedfile_id == StoredFileModel.id]
+    if imageset_ids is not None:
+        usage.append(ImageSetAssociationModel.imageset_id.in_(imageset_ids))
+    q = session.query(StoredFileModel.id,
+                      ImageSetAssociationModel.imageset_id,
+                      ImageSetAssociationModel.position)
+    q = q.outerjoin(ImageSetAssociationModel, and_(*usage))
+    q = q.filter(StoredFileModel.id.in_(storedfile_ids))
+    if interest_id is not None:
+        q = q.filter(StoredFileModel.interest_id == interest_id)
+    q = q.order_by(StoredFileModel.id,
+                   ImageSetAssociationModel.imageset_id,
+                   ImageSetAssociationModel.position)
+    rv = {}
+    for storedfile_id, imageset_id, position in q:
+        references = rv.setdefault(storedfile_id, [])
+        if imageset_id is not None:
+            references.append({'imageset_id': imageset_id,
+                               'position': position})
+    return rv
+
+
+@with_db
+def imageset_orphaned_storedfiles(label='imageset', storedfile_ids=None, min_age=None,
+                                  exclude_states=None, after=None, limit=None, session=None):
+    # StoredFiles with the label which no imageset or revision references.
+    # With exclude_states, files of interests in any of those states are
+    # left out.
+    q = session.query(StoredFileModel).filter(StoredFileModel.label == label)
+    q = q.filter(~exists().where(ImageSetAssociationModel.storedfile_id == StoredFileModel.id))
+    q = q.filter(~exists().where(ImageSetRevisionItemModel.storedfile_id == StoredFileModel.id))
+    if exclude_states:
+        q = q.filter(~exists().where(InterestModel.id == StoredFileModel.interest_id,
+                                     InterestModel.status.in_(exclude_states)))
+    if storedfile_ids is not None:
+        q = q.filter(StoredFileModel.id.in_(storedfile_ids))
+    if min_age:
+        q = q.filter(StoredFileModel.created_at < datetime.utcnow() - timedelta(seconds=min_age))
+    if after is not None:
+        q = q.filter(StoredFileModel.id > after)
+    q = q.order_by(StoredFileModel.id)
+    if limit:
+        q = q.limit(limit)
+    return q.all()
+
+
+@with_db
+def imageset_storedfile_owners(storedfile_ids, session=None):
+    # Returns the puid of the owning user of each of the StoredFiles.
+    if not storedfile_ids:
+        return {}
+    q = session.query(StoredFileModel.id, UserModel.puid)
+    q = q.join(UserModel, UserModel.id == StoredFileModel.user_id)
+    q = q.filter(StoredFileModel.id.in_(storedfile_ids))
+    return dict(q.all())
+
+
+@with_db
+def imageset_claim_version(id, expected=None, session=None):
+    # Compare-and-swap on the imageset version. Returns the new version, or
+    # None if the imageset is not at the expected version. The update holds
+    # the row lock until the transaction ends.
+    q = session.query(ImageSetModel).filter(ImageSetModel.id == id)
+    if expected is not None:
+        q = q.filter(ImageSetModel.version == expected)
+    if not q.update({ImageSetModel.version: ImageSetModel.version + 1},
+                    synchronize_session=False):
+        return None
+    return session.query(ImageSetModel.version).filter(ImageSetModel.id == id).scalar()
+
 # TODO The functions below are pulled from device_content sequences. They
 #  have some changes, but not a lot. Consider if they can be repackaged
 #  into some kind of reusable mixin or so.
 
+
+def _export_options():
+    # Loads only what ImageSetAssociationModel.export() needs from the
+    # StoredFile, alongside the association rows themselves.
+    return [joinedload(ImageSetAssociationModel.storedfile)
+            .load_only(StoredFileModel.filename)
+            .joinedload(StoredFileModel.bucket)]
+
+
+@with_db
+def imageset_positions(id, session=None):
+    q = session.query(ImageSetAssociationModel.position)
+    q = q.filter(ImageSetAssociationModel.imageset_id == id)
+    q = q.order_by(ImageSetAssociationModel.position)
+    return [x for x, in q]
+
+
 @with_db
 def imageset_next_position(id=None, session=None):
+    q = session.query(func.max(ImageSetAssociationModel.position))
+    q = q.filter(ImageSetAssociationModel.imageset_id == id)
+    last = q.scalar()
+    if last is not None:
+        return last + 1
     try:
-        imageset = get_imageset(id=id, session=session)
-        return max([x.position for x in imageset.contents], default=-1) + 1
+        get_imageset(id=id, session=session)
     except NoResultFound:
         raise ValueError(f"Could not find an 'imageset' "
                          f"container with the provided id {id}")
+    return 0
 
 
 @with_db
 def imageset_get_at_position(id, position, session=None):
-    try:
-        imageset = get_imageset(id=id, session=session)
-        for x in imageset.contents:
-            if x.position == position:
-                return x
-    except NoResultFound:
-        raise ValueError(f"Could not find an 'imageset' "
-                         f"container with the provided id {id}")
+    q = session.query(ImageSetAssociationModel)
+    q = q.filter(ImageSetAssociationModel.imageset_id == id,
+                 ImageSetAssociationModel.position == position)
+    return q.one_or_none()
 
 
 @with_db
 def imageset_prep_position(id, position, session=None):
-    existing = imageset_get_at_position(id, position, session=session)
-    if not existing:
-        return
-    imageset_prep_position(id, position + 1, session=session)
-    existing.position = position + 1
+    # Shift everything at or after position up by one. This is done in two
+    # steps through negative positions so that no intermediate state
+    # collides on the (imageset_id, position) primary key.
+    q = session.query(ImageSetAssociationModel)
+    q = q.filter(ImageSetAssociationModel.imageset_id == id)
+    q.filter(ImageSetAssociationModel.position >= position).update(
+        {ImageSetAssociationModel.position: -ImageSetAssociationModel.position - 2},
+        synchronize_session=False)
+    q.filter(ImageSetAssociationModel.position < 0).update(
+        {ImageSetAssociationModel.position: -ImageSetAssociationModel.position - 1},
+        synchronize_session=False)
     session.flush()
 
 
 @with_db
 def imageset_get_contents(id, session=None):
     try:
-        imageset = get_imageset(id=id, session=session)
+        get_imageset(id=id, session=session)
     except NoResultFound:
         raise ValueError(f"Could not find a 'imageset' "
                          f"container with the provided id {id}")
@@ -82,11 +211,131 @@ def imageset_get_contents(id, session=None):
         'position': c.position,
         'duration': c.duration,
         'content': c.storedfile,
-    } for c in imageset.contents]
+    } for c in imageset_get_window(id=id, session=session)]
+
+
+@with_db
+def imageset_get_contents_bulk(ids, session=None):
+    q = session.query(ImageSetAssociationModel).options(*_export_options())
+    q = q.filter(ImageSetAssociationModel.imageset_id.in_(ids))
+    q = q.order_by(ImageSetAssociationModel.imageset_id,
+                   ImageSetAssociationModel.position)
+    rv = {x: [] for x in ids}
+    for assn in q:
+        rv[assn.imageset_id].append(assn)
+    return rv
+
+
+@with_db
+def imageset_get_storedfiles(id, session=None):
+    q = session.query(StoredFileModel).options(joinedload(StoredFileModel.bucket))
+    q = q.join(ImageSetAssociationModel, ImageSetAssociationModel.storedfile_id == StoredFileModel.id)
+    q = q.filter(ImageSetAssociationModel.imageset_id == id)
+    q = q.order_by(ImageSetAssociationModel.position)
+    return q.all()
+
+
+@with_db
+def imageset_get_window(id, offset=None, limit=None, after=None, session=None):
+    q = session.query(ImageSetAssociationModel).options(*_export_options())
+    q = q.filter(ImageSetAssociationModel.imageset_id == id)
+    if after is not None:
+        q = q.filter(ImageSetAssociationModel.position > after)
+    q = q.order_by(ImageSetAssociationModel.position)
+    if offset:
+        q = q.offset(offset)
+    if limit:
+        q = q.limit(limit)
+    return q.all()
+
+
+@with_db
+def imageset_get_available(id, interest_id, label='imageset', offset=None, limit=None,
+                           after=None, session=None):
+    # StoredFiles of the interest which can be added to the imageset, each
+    # with whether it is already in the imageset. Returns the requested
+    # window of (storedfile, in_set) rows along with the total count.
+    in_set = exists().where(ImageSetAssociationModel.imageset_id == id,
+                            ImageSetAssociationModel.storedfile_id == StoredFileModel.id)
+    filters = [StoredFileModel.interest_id == interest_id,
+               StoredFileModel.label == label]
+    total_count = session.query(func.count(StoredFileModel.id)).filter(*filters).scalar()
+
+    q = session.query(StoredFileModel, in_set.label('in_set'))
+    q = q.options(load_only(StoredFileModel.filename),
+                  joinedload(StoredFileModel.bucket))
+    q = q.filter(*filters)
+    if after is not None:
+        q = q.filter(StoredFileModel.id > after)
+    q = q.order_by(StoredFileModel.id)
+    if offset:
+        q = q.offset(offset)
+    if limit:
+        q = q.limit(limit)
+    return q.all(), total_count
+
+
+@with_db
+def imageset_refresh_summary(id=None, storedfile_ids=None,
+                             publish_bucket=IMAGESET_PUBLISHING_FILESTORE_BUCKET,
+                             session=None):
+    # Recomputes the summary columns of the imageset, or of every imageset
+    # containing any of the given storedfiles, in a single statement.
+    in_imageset = ImageSetAssociationModel.imageset_id == ImageSetModel.id
+    item_count = select(func.count(ImageSetAssociationModel.position))
+    item_count = item_count.where(in_imageset).scalar_subquery()
+    duration = func.coalesce(ImageSetAssociationModel.duration, ImageSetModel.default_duration)
+    total_duration = select(func.coalesce(func.sum(duration), 0))
+    total_duration = total_duration.where(in_imageset).scalar_subquery()
+    unpublished = exists().where(
+        in_imageset,
+        ImageSetAssociationModel.storedfile_id == StoredFileModel.id,
+        ~StoredFileModel.bucket.has(name=publish_bucket)
+    )
+
+    stmt = update(ImageSetModel).values(item_count=item_count,
+                                        total_duration=total_duration,
+                                        all_published=~unpublished)
+    if id is not None:
+        stmt = stmt.where(ImageSetModel.id == id)
+    elif storedfile_ids is not None:
+        containing = select(ImageSetAssociationModel.imageset_id).where(
+            ImageSetAssociationModel.storedfile_id.in_(storedfile_ids))
+        stmt = stmt.where(ImageSetModel.id.in_(containing))
+    else:
+        raise ValueError("Expecting either an imageset id or storedfile ids")
+    session.execute(stmt, execution_options={'synchronize_session': 'fetch'})
+    session.flush()
+
+
+@with_db
+def imageset_get_schedule(id, session=None):
+    try:
+        imageset = get_imageset(id=id, session=session)
+    except NoResultFound:
+        raise ValueError(f"Could not find a 'imageset' "
+                         f"container with the provided id {id}")
+    q = session.query(ImageSetAssociationModel.position,
+                      ImageSetAssociationModel.storedfile_id,
+                      ImageSetAssociationModel.duration)
+    q = q.filter(ImageSetAssociationModel.imageset_id == id)
+    q = q.order_by(ImageSetAssociationModel.position)
+    return imageset.default_duration, q.all()
 
 
 @with_db
-def imageset_add_content(id, storedfile, position=None, duration=None, session=None):
+def imageset_get_media(storedfile_id, session=None):
+    # Media metadata already recorded for the storedfile in any imageset.
+    q = session.query(*[getattr(ImageSetAssociationModel, x) for x in MEDIA_COLUMNS])
+    q = q.filter(ImageSetAssociationModel.storedfile_id == storedfile_id)
+    row = q.limit(1).one_or_none()
+    if row is None:
+        return {}
+    return dict(zip(MEDIA_COLUMNS, row))
+
+
+@with_db
+def imageset_add_content(id, storedfile, position=None, duration=None, media=None, session=None):
     storedfile_id = storedfile
     if position is None:
         position = imageset_next_position(id=id, session=session)
@@ -94,12 +343,16 @@ def imageset_add_content(id, storedfile, position=None, duration=None, session=N
         imageset_prep_position(id, position, session=session)
     if not storedfile_id:
         raise ValueError(f"Don't have a valid storedfile_id. Got {storedfile}")
+    if media is None:
+        media = imageset_get_media(storedfile_id, session=session)
     association = ImageSetAssociationModel(imageset_id=id,
                                            storedfile_id=storedfile_id,
                                            position=position,
-                                           duration=duration)
+                                           duration=duration,
+                                           **media)
     session.add(association)
-    session.commit()
+    session.flush()
+    imageset_refresh_summary(id=id, session=session)
 
 
 @with_db
@@ -109,29 +362,229 @@ def imageset_remove_content(id, position, session=None):
         raise ValueError(f"Imageset does not seem to have any "
                          f"content at position {position}.")
     session.delete(assn)
-    session.commit()
+    session.flush()
+    imageset_refresh_summary(id=id, session=session)
 
 
 @with_db
-def imageset_pull_back_position(id, position, to_position, session=None):
-    assn = imageset_get_at_position(id=id, position=position, session=session)
-    if not assn:
-        imageset_pull_back_position(id, position + 1, to_position, session=session)
+def imageset_remove_contents(id, positions=None, storedfile_ids=None, start=None, end=None, session=None):
+    # Removes every item matching all of the provided criteria in a single
+    # statement. start is inclusive and end is exclusive. Returns the
+    # storedfile ids of the removed items.
+    criteria = [ImageSetAssociationModel.imageset_id == id]
+    if positions is not None:
+        criteria.append(ImageSetAssociationModel.position.in_(positions))
+    if storedfile_ids is not None:
+        criteria.append(ImageSetAssociationModel.storedfile_id.in_(storedfile_ids))
+    if start is not None:
+        criteria.append(ImageSetAssociationModel.position >= start)
+    if end is not None:
+        criteria.append(ImageSetAssociationModel.position < end)
+    if len(criteria) == 1:
+        raise ValueError("Refusing to remove imageset contents without any criteria")
+    stmt = delete(ImageSetAssociationModel).where(*criteria)
+    stmt = stmt.returning(ImageSetAssociationModel.storedfile_id)
+    removed = session.execute(stmt, execution_options={'synchronize_session': False})
+    removed = [x for x, in removed]
+    imageset_refresh_summary(id=id, session=session)
+    return removed
+
+
+@with_db
+def imageset_set_durations(id, durations, by='position', session=None):
+    # durations maps positions or storedfile ids to the duration to be set.
+    # A duration of None resets the item to the imageset default.
+    if by == 'position':
+        key = ImageSetAssociationModel.position
+    elif by == 'storedfile':
+        key = ImageSetAssociationModel.storedfile_id
     else:
-        assn.position = to_position
-        session.commit()
+        raise ValueError(f"Cannot set imageset durations by '{by}'")
+    if not durations:
+        return 0
+    new_durations = values(column('key', Integer), column('duration', Integer),
+                           name='new_durations').data(list(durations.items()))
+    stmt = update(ImageSetAssociationModel)
+    stmt = stmt.where(ImageSetAssociationModel.imageset_id == id,
+                      key == new_durations.c.key)
+    # The durations may all be None, which leaves the VALUES column untyped.
+    stmt = stmt.values(duration=cast(new_durations.c.duration, Integer))
+    result = session.execute(stmt, execution_options={'synchronize_session': False})
+    imageset_refresh_summary(id=id, session=session)
+    return result.rowcount
 
 
 @with_db
-def imageset_heal_positions(id=None, session=None):
+def imageset_set_all_durations(id, duration, session=None):
+    q = session.query(ImageSetAssociationModel)
+    q = q.filter(ImageSetAssociationModel.imageset_id == id)
+    count = q.update({ImageSetAssociationModel.duration: duration},
+                     synchronize_session=False)
+    imageset_refresh_summary(id=id, session=session)
+    return count
+
+
+@with_db
+def imageset_scale_durations(id, factor, session=None):
+    default_duration = select(ImageSetModel.default_duration)
+    default_duration = default_duration.where(ImageSetModel.id == id).scalar_subquery()
+    scaled = cast(func.round(func.coalesce(ImageSetAssociationModel.duration,
+                                           default_duration) * factor), Integer)
+    q = session.query(ImageSetAssociationModel)
+    q = q.filter(ImageSetAssociationModel.imageset_id == id)
+    count = q.update({ImageSetAssociationModel.duration: case((scaled < 1, 1), else_=scaled)},
+                     synchronize_session=False)
+    imageset_refresh_summary(id=id, session=session)
+    return count
+
+
+def _copy_rows(target, source, source_filter, **replace):
+    # INSERT ... SELECT of every column the two tables have in common, with
+    # the columns in replace set to the provided values instead.
+    source_columns = source.__table__.columns
+    names = [c.name for c in target.__table__.columns
+             if c.name in replace or c.name in source_columns]
+    rows = select(*[literal(replace[n]).label(n) if n in replace else source_columns[n]
+                    for n in names])
+    rows = rows.where(source_filter)
+    return insert(target).from_select(names, rows)
+
+
+@with_db
+def imageset_clone(source_id, target_id, session=None):
+    # Replaces the contents of the target with those of the source. Nothing
+    # here commits, so the caller's transaction swaps the contents atomically.
+    if source_id == target_id:
+        raise ValueError(f"Cannot clone imageset {source_id} into itself")
+    try:
+        source = get_imageset(id=source_id, session=session)
+        target = get_imageset(id=target_id, session=session)
+    except NoResultFound:
+        raise ValueError(f"Could not find the 'imageset' containers with "
+                         f"the provided ids {source_id}, {target_id}")
+    target.default_duration = source.default_duration
+    target.bgcolor = source.bgcolor
+    target.color = source.color
+    session.flush()
+
+    session.query(ImageSetAssociationModel).filter(
+        ImageSetAssociationModel.imageset_id == target_id
+    ).delete(synchronize_session=False)
+
+    # StoredFiles are shared with the source imageset, not copied.
+    session.execute(_copy_rows(ImageSetAssociationModel, ImageSetAssociationModel,
+                               ImageSetAssociationModel.imageset_id == source_id,
+                               imageset_id=target_id))
+    imageset_refresh_summary(id=target_id, session=session)
+
+
+@with_db
+def imageset_get_revisions(id, session=None):
+    q = session.query(ImageSetRevisionModel)
+    q = q.filter(ImageSetRevisionModel.imageset_id == id)
+    q = q.order_by(ImageSetRevisionModel.id.desc())
+    return q.all()
+
+
+@with_db
+def imageset_create_revision(id, comment=None, session=None):
     try:
         imageset = get_imageset(id=id, session=session)
-        session.expire(imageset)
-        if not len(imageset.contents):
-            return
-        for position in range(len(imageset.contents)):
-            if not imageset_get_at_position(id=id, position=position, session=session):
-                imageset_pull_back_position(id=id, position=position + 1, to_position=position, session=session)
     except NoResultFound:
         raise ValueError(f"Could not find a 'imageset' "
                          f"container with the provided id {id}")
+    # Revisions are immutable, so a revision of an unchanged imageset is
+    # simply the latest revision at that version.
+    q = session.query(ImageSetRevisionModel)
+    q = q.filter(ImageSetRevisionModel.imageset_id == id,
+                 ImageSetRevisionModel.version == imageset.version)
+    existing = q.order_by(ImageSetRevisionModel.id.desc()).first()
+    if existing:
+        return existing
+
+    revision = ImageSetRevisionModel(imageset_id=id,
+                                     version=imageset.version,
+                                     comment=comment,
+                                     item_count=imageset.item_count,
+                                     default_duration=imageset.default_duration,
+                                     bgcolor=imageset.bgcolor,
+                                     color=imageset.color)
+    session.add(revision)
+    session.flush()
+    session.execute(_copy_rows(ImageSetRevisionItemModel, ImageSetAssociationModel,
+                               ImageSetAssociationModel.imageset_id == id,
+                               revision_id=revision.id))
+    session.flush()
+    imageset_prune_revisions(id=id, session=session)
+    return revision
+
+
+@with_db
+def imageset_prune_revisions(id, keep=IMAGESET_REVISION_RETENTION, session=None):
+    # Removes all but the latest keep revisions of the imageset. Files only
+    # referenced by the pruned revisions become eligible for collection.
+    if not keep:
+        return 0
+    q = session.query(ImageSetRevisionModel.id)
+    q = q.filter(ImageSetRevisionModel.imageset_id == id)
+    pruned = [x for x, in q.order_by(ImageSetRevisionModel.id.desc()).offset(keep)]
+    if not pruned:
+        return 0
+    session.execute(delete(ImageSetRevisionItemModel)
+                    .where(ImageSetRevisionItemModel.revision_id.in_(pruned)))
+    session.execute(delete(ImageSetRevisionModel)
+                    .where(ImageSetRevisionModel.id.in_(pruned)),
+                    execution_options={'synchronize_session': False})
+    return len(pruned)
+
+
+@with_db
+def imageset_restore_revision(id, revision_id, session=None):
+    # Replaces the live contents with those of the revision. Nothing here
+    # commits, so the caller's transaction swaps the contents atomically.
+    revision = session.get(ImageSetRevisionModel, revision_id)
+    if not revision or revision.imageset_id != id:
+        raise ValueError(f"Imageset {id} does not have a revision {revision_id}")
+    imageset = get_imageset(id=id, session=session)
+    imageset.default_duration = revision.default_duration
+    imageset.bgcolor = revision.bgcolor
+    imageset.color = revision.color
+    session.flush()
+
+    session.query(ImageSetAssociationModel).filter(
+        ImageSetAssociationModel.imageset_id == id
+    ).delete(synchronize_session=False)
+    session.execute(_copy_rows(ImageSetAssociationModel, ImageSetRevisionItemModel,
+                               ImageSetRevisionItemModel.revision_id == revision_id,
+                               imageset_id=id))
+    imageset_refresh_summary(id=id, session=session)
+    return revision
+
+
+@with_db
+def imageset_heal_positions(id=None, session=None):
+    try:
+        get_imageset(id=id, session=session)
+    except NoResultFound:
+        raise ValueError(f"Could not find a 'imageset' "
+                         f"container with the provided id {id}")
+    # Rows which need to move are first parked at negative positions derived
+    # from their targets, and then flipped back, so that no intermediate
+    # state collides on the (imageset_id, position) primary key.
+    ranked = select(ImageSetAssociationModel.position,
+                    (func.row_number().over(order_by=ImageSetAssociationModel.position) - 1).label('target'))
+    ranked = ranked.where(ImageSetAssociationModel.imageset_id == id).subquery()
+    session.execute(
+        update(ImageSetAssociationModel)
+        .where(ImageSetAssociationModel.imageset_id == id,
+               ImageSetAssociationModel.position == ranked.c.position,
+               ranked.c.position != ranked.c.target)
+        .values(position=-ranked.c.target - 1),
+        execution_options={'synchronize_session': False}
+    )
+    session.query(ImageSetAssociationModel).filter(
+        ImageSetAssociationModel.imageset_id == id,
+        ImageSetAssociationModel.position < 0
+    ).update({ImageSetAssociationModel.position: -ImageSetAssociationModel.position - 1},
+             synchronize_session=False)
+    session.commit()
@@ -2,9 +2,15 @@
 
 from typing import List
 from typing import Optional
+from datetime import datetime
 from sqlalchemy import Column
 from sqlalchemy import VARCHAR
 from sqlalchemy import Integer
+from sqlalchemy import Boolean
+from sqlalchemy import Float
+from sqlalchemy import BigInteger
+from sqlalchemy import Index
+from sqlalchemy import true
 from sqlalchemy import ForeignKey
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
@@ -22,13 +28,22 @@ class ImageSetContentTModel(TendrilTBaseModel):
     duration: Optional[int]
     storedfile_id: Optional[int]
     content: str
+    width: Optional[int]
+    height: Optional[int]
+    aspect_ratio: Optional[float]
+    pages: Optional[int]
+    size: Optional[int]
 
 
 class ImageSetTModel(TendrilTBaseModel):
-    default_duration: Optional[int]
-    bgcolor: Optional[str]
-    color: Optional[str]
-    contents: Optional[List[ImageSetContentTModel]]
+    version: Optional[int] = None
+    item_count: Optional[int] = None
+    total_duration: Optional[int] = None
+    all_published: Optional[bool] = None
+    default_duration: Optional[int] = None
+    bgcolor: Optional[str] = None
+    color: Optional[str] = None
+    contents: Optional[List[ImageSetContentTModel]] = None
 
 
 class ImageSetModel(DeclBase, BaseMixin, TimestampMixin):
@@ -37,12 +52,23 @@ class ImageSetModel(DeclBase, BaseMixin, TimestampMixin):
     default_duration = Column(Integer, nullable=False, default=10)
     bgcolor = Column(VARCHAR(9), nullable=True)
     color = Column(VARCHAR(9), nullable=True)
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+
+    # Summary of the contents, maintained by the imageset controllers so that
+    # listings can sort and filter on them without reading the contents.
+    item_count = Column(Integer, nullable=False, default=0, server_default='0')
+    total_duration = Column(Integer, nullable=False, default=0, server_default='0')
+    all_published = Column(Boolean, nullable=False, default=True, server_default=true())
 
     contents: Mapped[List["ImageSetAssociationModel"]] = \
         relationship(order_by="ImageSetAssociationModel.position")
 
     def export(self, full=False):
         rv = {
+            'version': self.version,
+            'item_count': self.item_count,
+            'total_duration': self.total_duration,
+            'all_published': self.all_published,
             'default_duration': self.default_duration,
             'bgcolor': self.bgcolor,
             'color': self.color,
@@ -51,14 +77,32 @@ class ImageSetModel(DeclBase, BaseMixin, TimestampMixin):
         return rv
 
 
-class ImageSetAssociationModel(DeclBase):
+MEDIA_COLUMNS = ('width', 'height', 'aspect_ratio', 'pages', 'size')
+
+
+class ImageSetMediaMixin(object):
+    # Media metadata of the item, recorded when it is added, so that clients
+    # can lay out and filter items without fetching the files.
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    aspect_ratio = Column(Float, nullable=True)
+    pages = Column(Integer, nullable=True)
+    size = Column(BigInteger, nullable=True)
+
+
+class ImageSetAssociationModel(ImageSetMediaMixin, DeclBase):
     __tablename__ = "ImageSetAssociation"
+    __table_args__ = (
+        Index('ImageSetAssociation_imageset_id_aspect_ratio_idx', 'imageset_id', 'aspect_ratio'),
+    )
     imageset_id: Mapped[int] = mapped_column(ForeignKey("ImageSet.id"), primary_key=True)
-    storedfile_id: Mapped[int] = mapped_column(ForeignKey("StoredFile.id"))
+    storedfile_id: Mapped[int] = mapped_column(ForeignKey("StoredFile.id"), index=True)
     position: Mapped[int] = mapped_column(primary_key=True)
     duration: Mapped[Optional[int]]
-    imageset: Mapped[ImageSetModel] = relationship(back_populates="contents", foreign_keys=[imageset_id], lazy='selectin')
-    storedfile: Mapped[StoredFileModel] = relationship(foreign_keys=[storedfile_id], lazy='joined')
+    # Hot paths use explicit loader options or column queries instead of
+    # relying on these. See tendril.db.controllers.imageset.
+    imageset: Mapped[ImageSetModel] = relationship(back_populates="contents", foreign_keys=[imageset_id], lazy='select')
+    storedfile: Mapped[StoredFileModel] = relationship(foreign_keys=[storedfile_id], lazy='selectin')
 
     def export(self):
         return {
@@ -66,4 +110,55 @@ class ImageSetAssociationModel(DeclBase):
             'duration': self.duration,
             'storedfile_id': self.storedfile_id,
             'content': self.storedfile.expose_uri,
+            'width': self.width,
+            'height': self.height,
+            'aspect_ratio': self.aspect_ratio,
+            'pages': self.pages,
+            'size': self.size,
+        }
+
+
+class ImageSetRevisionTModel(TendrilTBaseModel):
+    id: int
+    version: int
+    comment: Optional[str]
+    item_count: int
+    default_duration: int
+    bgcolor: Optional[str]
+    color: Optional[str]
+    created_at: Optional[datetime]
+
+
+class ImageSetRevisionModel(DeclBase, BaseMixin, TimestampMixin):
+    # An immutable snapshot of an imageset at a particular version. Items are
+    # compact copies of the association rows. StoredFiles are shared with the
+    # live imageset and are never copied.
+    id = Column(Integer, primary_key=True)
+    imageset_id: Mapped[int] = mapped_column(ForeignKey("ImageSet.id"), index=True)
+    version: Mapped[int]
+    comment: Mapped[Optional[str]] = mapped_column(VARCHAR(255))
+    item_count: Mapped[int] = mapped_column(default=0)
+    default_duration: Mapped[int]
+    bgcolor: Mapped[Optional[str]] = mapped_column(VARCHAR(9))
+    color: Mapped[Optional[str]] = mapped_column(VARCHAR(9))
+
+    def export(self, full=False):
+        rv = {
+            'id': self.id,
+            'version': self.version,
+            'comment': self.comment,
+            'item_count': self.item_count,
+            'default_duration': self.default_duration,
+            'bgcolor': self.bgcolor,
+            'color': self.color,
+            'created_at': self.created_at,
         }
+        return rv
+
+
+class ImageSetRevisionItemModel(ImageSetMediaMixin, DeclBase):
+    __tablename__ = "ImageSetRevisionItem"
+    revision_id: Mapped[int] = mapped_column(ForeignKey("ImageSetRevision.id"), primary_key=True)
+    position: Mapped[int] = mapped_column(primary_key=True)
+    storedfile_id: Mapped[int] = mapped_column(ForeignKey("StoredFile.id"), index=True)
+    duration: Mapped[Optional[int]]
@@ -9,6 +9,7 @@ from httpx import HTTPStatusError
 from tendril.filestore import buckets
 from tendril.config import IMAGESET_UPLOAD_FILESTORE_BUCKET
 from tendril.config import IMAGESET_PUBLISHING_FILESTORE_BUCKET
+from tendril.config import IMAGESET_PUBLISH_CONCURRENCY
 
 from tendril.interests.mixins.base import InterestMixinBase
 from tendril.common.states import LifecycleStatus
@@ -18,19 +19,83 @@ from tendril.authz.roles.interests import require_permission
 from tendril.caching import tokens
 from tendril.caching.tokens import TokenStatus
 
+from tendril.db.controllers.imageset import get_imageset
 from tendril.db.controllers.imageset import create_imageset
 from tendril.db.controllers.imageset import imageset_add_content
 from tendril.db.controllers.imageset import imageset_remove_content
+from tendril.db.controllers.imageset import imageset_remove_contents
 from tendril.db.controllers.imageset import imageset_heal_positions
+from tendril.db.controllers.imageset import imageset_storedfile_references
+from tendril.db.controllers.imageset import imageset_clone
+from tendril.db.controllers.imageset import imageset_get_revisions
+from tendril.db.controllers.imageset import imageset_create_revision
+from tendril.db.controllers.imageset import imageset_restore_revision
+from tendril.db.controllers.imageset import imageset_get_window
+from tendril.db.controllers.imageset import imageset_get_available
+from tendril.db.controllers.imageset import imageset_refresh_summary
+from tendril.db.controllers.imageset import imageset_get_storedfiles
+from tendril.db.controllers.imageset import imageset_claim_version
+from tendril.db.controllers.imageset import imageset_set_durations
+from tendril.db.controllers.imageset import imageset_set_all_durations
+from tendril.db.controllers.imageset import imageset_scale_durations
+from tendril.common.interests.exceptions import InterestStateException
+from tendril.common.imageset.exceptions import ImageSetVersionConflict
 from tendril.filestore.db.controller import get_storedfile_owner
 
 from tendril.utils.parsers.media.info import get_media_info
+from tendril.structures.imageset.progress import TokenReporter
+from tendril.structures.imageset.timeline import get_timeline
+from tendril.structures.imageset.gc import collect_storedfiles
+from tendril.structures.imageset.threads import run_sync
+from tendril.structures.imageset import access
 
 from tendril.utils.db import with_db
 from tendril.utils import log
 logger = log.get_logger(__name__, log.DEFAULT)
 
 
+@with_db
+def read_imageset_contents(interest_id, imageset_id, offset=None, limit=None, after=None, session=None):
+    # No access checks are made here. Callers either go through the interest
+    # or have the access already resolved, see structures.imageset.access.
+    # Without windowing parameters, all rows are loaded. The totals always
+    # describe the full imageset and come from its summary columns.
+    imageset = get_imageset(id=imageset_id, session=session)
+    contents = imageset_get_window(id=imageset_id,
+                                   offset=offset, limit=limit, after=after,
+                                   session=session)
+    contents = [x.export() for x in contents]
+
+    next_after = None
+    if limit and len(contents) == limit:
+        next_after = contents[-1]['position']
+
+    rv = {'interest_id': interest_id,
+          'version': imageset.version,
+          'default_duration': imageset.default_duration,
+          'bgcolor': imageset.bgcolor,
+          'color': imageset.color,
+          'contents': contents,
+          'next_after': next_after,
+          'item_count': imageset.item_count,
+          'total_count': imageset.item_count,
+          'total_duration': imageset.total_duration,
+          'all_published': imageset.all_published}
+    return rv
+
+
+@with_db
+def read_imageset_timeline(interest_id, imageset_id, t=None, session=None):
+    imageset = get_imageset(id=imageset_id, session=session)
+    timeline = get_timeline(imageset_id, imageset.version, session=session)
+    rv = {'interest_id': interest_id,
+          'version': imageset.version}
+    rv.update(timeline.export())
+    if t is not None:
+        rv['current'] = timeline.at(t)
+    return rv
+
+
 class InterestImageSetMixin(InterestMixinBase):
     token_namespace = 'isu'
     upload_bucket_name = IMAGESET_UPLOAD_FILESTORE_BUCKET
@@ -52,50 +117,110 @@ class InterestImageSetMixin(InterestMixinBase):
         if not self.model_instance.status == LifecycleStatus.ACTIVE:
             return result, msg
 
-        publishable = self.publishable()
+        publishable = self.publishable(session=session)
 
         if background_tasks:
             background_tasks.add_task(self._publish_files, publishable)
         else:
             asyncio.ensure_future(self._publish_files(publishable))
+
+        # Whatever goes live is kept as a revision, so it can be restored
+        # if later edits break it.
+        imageset_create_revision(id=self.model_instance.imageset_id,
+                                 comment="Activated", session=session)
+        access.invalidate(self.id)
         return result, msg
 
+    # Membership changes alter who may read the imageset, so cached read
+    # grants for the interest are dropped. See structures.imageset.access.
+    def assign_role(self, *args, **kwargs):
+        rv = super().assign_role(*args, **kwargs)
+        access.invalidate(self.id)
+        return rv
+
+    def remove_role(self, *args, **kwargs):
+        rv = super().remove_role(*args, **kwargs)
+        access.invalidate(self.id)
+        return rv
+
+    def remove_user(self, *args, **kwargs):
+        rv = super().remove_user(*args, **kwargs)
+        access.invalidate(self.id)
+        return rv
+
     # TODO This may collide with other mixins. Improve superstructure. Perhaps a publishable mixin?
     async def _publish_files(self, stored_files):
-        for stored_file in stored_files:
-            logger.info(f"Publishing file {stored_file.filename}")
-            try:
-                upload_response = await self.upload_bucket.move(
-                    filename=stored_file.filename,
-                    target_bucket=self.publish_bucket_name,
-                    actual_user=None,
-                )
-            except HTTPStatusError as e:
-                self._report_filestore_error(None, e, "Publishing imageset file")
-                continue
+        # Moves the files with a bounded number of concurrent requests.
+        # Returns the move result for each filename, with None for files
+        # which could not be moved.
+        filenames = [x.filename for x in stored_files]
+        if not filenames:
+            return {}
+        logger.info(f"Publishing {len(filenames)} imageset files for interest {self.id}")
+
+        results = await self._publish_concurrently(filenames)
+
+        failed = [k for k, v in results.items() if not v]
+        if failed:
+            logger.warn(f"Could not publish {len(failed)} imageset files for interest {self.id} : {failed}")
+
+        # Moved files may also be in other imagesets, such as clones.
+        moved = [x.id for x in stored_files if results.get(x.filename)]
+        if moved:
+            await run_sync(imageset_refresh_summary, storedfile_ids=moved,
+                           publish_bucket=self.publish_bucket_name)
+        return results
+
+    async def _publish_concurrently(self, filenames):
+        semaphore = asyncio.Semaphore(IMAGESET_PUBLISH_CONCURRENCY)
+
+        async def _move(filename):
+            async with semaphore:
+                try:
+                    return await self.upload_bucket.move(
+                        filename=filename,
+                        target_bucket=self.publish_bucket_name,
+                        actual_user=None,
+                    )
+                except HTTPStatusError as e:
+                    self._report_filestore_error(None, e, "Publishing imageset file")
+                    return None
+
+        move_responses = await asyncio.gather(*[_move(x) for x in filenames])
+        return dict(zip(filenames, move_responses))
+
+    def _stage_contents(self, background_tasks=None, session=None):
+        # Contents replaced wholesale, by a clone or a revision restore, may
+        # refer to files which have not been published. If the interest is
+        # active, they are published now. Otherwise, activate() does it.
+        if self.status != LifecycleStatus.ACTIVE:
+            return
+        publishable = self.publishable(session=session)
+        if not publishable:
+            return
+        if background_tasks:
+            background_tasks.add_task(self._publish_files, publishable)
+        else:
+            async_to_sync(self._publish_files)(publishable)
 
     # TODO This may collide with other mixins. Improve superstructure or standardize. Perhaps a publishable mixin?
-    def publishable(self):
-        rv = []
-        for content in self.model_instance.imageset.contents:
-            if content.storedfile.bucket.name == self.upload_bucket_name:
-                rv.append(content.storedfile)
-        return rv
+    def publishable(self, session=None):
+        return [x for x in imageset_get_storedfiles(self.model_instance.imageset_id, session=session)
+                if x.bucket.name == self.upload_bucket_name]
 
     # TODO This may collide with other mixins. Improve superstructure or standardize. Perhaps a publishable mixin?
     def published(self):
         if self.status != LifecycleStatus.ACTIVE:
             return False
-        for content in self.model_instance.imageset.contents:
-            if content.storedfile.bucket.name != self.publish_bucket_name:
-                return False
-        return True
+        return self.model_instance.imageset.all_published
 
     @with_db
     def _commit_to_db(self, must_create=False, can_create=True, session=None):
         super(InterestImageSetMixin, self)._commit_to_db(must_create=must_create,
                                                          can_create=can_create,
                                                          session=session)
+        # Lifecycle transitions are committed through here.
+        access.invalidate(self.id)
         if not self.model_instance.imageset_id:
             imageset = create_imageset(session=session)
             self.model_instance.imageset_id = imageset.id
@@ -106,20 +231,36 @@ class InterestImageSetMixin(InterestMixinBase):
     # TODO This may collide with other mixins. Improve superstructure or standardize. Maybe a filestore integration mixin?
     @property
     def upload_bucket(self):
-        if not hasattr(self, '_upload_bucket'):
-            self._upload_bucket = None
-        if not self._upload_bucket:
-            self._upload_bucket = buckets.get_bucket(self.upload_bucket_name)
-        return self._upload_bucket
+        return buckets.get_bucket(self.upload_bucket_name)
 
     # TODO This may collide with other mixins. Improve superstructure or standardize. Maybe a filestore integration mixin?
     @property
     def publish_bucket(self):
-        if not hasattr(self, '_publish_bucket'):
-            self._publish_bucket = None
-        if not self._publish_bucket:
-            self._publish_bucket = buckets.get_bucket(self.publish_bucket_name)
-        return self._publish_bucket
+        return buckets.get_bucket(self.publish_bucket_name)
+
+    @staticmethod
+    def _media_metadata(media_info):
+        general = getattr(media_info, 'general', None)
+        document = getattr(media_info, 'document', None)
+        try:
+            width, height = media_info.width(), media_info.height()
+        except NotImplementedError:
+            width, height = None, None
+        return {'width': width,
+                'height': height,
+                'aspect_ratio': width / height if width and height else None,
+                'pages': document.pages if document else None,
+                'size': general.file_size if general else None}
+
+    def _imageset_claim(self, action, expected_version=None, session=None):
+        # Every mutation bumps the imageset version. If the client provided
+        # the version it based its change on, the change is only allowed if
+        # the imageset is still at that version.
+        version = imageset_claim_version(id=self.model_instance.imageset_id,
+                                         expected=expected_version, session=session)
+        if version is None:
+            raise ImageSetVersionConflict(expected_version, action, self.id, self.name)
+        return version
 
     # TODO Standardize. We're also using this in device_content. Maybe a filestore integration mixin?
     def _report_filestore_error(self, token_id, e, action_comment):
@@ -139,18 +280,15 @@ class InterestImageSetMixin(InterestMixinBase):
     @require_permission('add_artefact', strip_auth=False)
     def upload_imageset_content(self, file, rename_to=None, token_id=None, auth_user=None, session=None):
         storage_folder = f'{self.id}'
-        if token_id:
-            tokens.update(self.token_namespace, token_id,
-                          state=TokenStatus.INPROGRESS, max=3,
-                          current="Parsing File Information")
+        reporter = TokenReporter(self.token_namespace, token_id)
+        reporter.update(state=TokenStatus.INPROGRESS, max=3,
+                        current="Parsing File Information")
 
         # 1. Parse Media Information
         filename = rename_to or file.filename
         media_info = get_media_info(file.file, filename=filename, original_filename=file.filename)
 
-        if token_id:
-            tokens.update(self.token_namespace, token_id,
-                          current="Uploading File to Filestore", done=1)
+        reporter.update(current="Uploading File to Filestore", done=1)
 
         # 2. Upload File to Bucket
         try:
@@ -159,80 +297,143 @@ class InterestImageSetMixin(InterestMixinBase):
                 actual_user=auth_user.id, interest=self.id, label="imageset"
             )
         except HTTPStatusError as e:
+            reporter.flush()
             self._report_filestore_error(token_id, e, "uploading imageset file to bucket")
             return
 
-        if token_id:
-            tokens.update(self.token_namespace, token_id, done=2,
-                          current="Linking File to Imageset",
-                          metadata={'storedfile_id': upload_response['storedfileid']})
+        reporter.update(done=2, current="Linking File to Imageset",
+                        metadata={'storedfile_id': upload_response['storedfileid']})
 
-        self.imageset_add(upload_response['storedfileid'], auth_user=auth_user, session=session)
+        self.imageset_add(upload_response['storedfileid'], media=self._media_metadata(media_info),
+                          auth_user=auth_user, session=session)
 
-        if token_id:
-            tokens.update(self.token_namespace, token_id, current="Finishing", done=3)
+        reporter.update(current="Finishing", done=3)
 
         # 7. Close Upload Ticket
-        tokens.close(self.token_namespace, token_id)
+        reporter.close()
 
     @with_db
     @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
     @require_permission('add_artefact', strip_auth=False)
-    def imageset_set_default_duration(self, default_duration=10, auth_user=None, session=None):
+    def imageset_set_default_duration(self, default_duration=10, expected_version=None,
+                                      auth_user=None, session=None):
 
         if not isinstance(default_duration, int) or default_duration <= 0:
             raise ValueError("Expecting a positive integer for duration")
 
+        version = self._imageset_claim('set_default_duration', expected_version, session=session)
         self.model_instance.imageset.default_duration = default_duration
         session.add(self.model_instance.imageset)
         session.flush()
+        imageset_refresh_summary(id=self.model_instance.imageset_id, session=session)
         return {'interest_id': self.id,
+                'version': version,
                 'default_duration': self.model_instance.imageset.default_duration}
 
     @with_db
     @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
     @require_permission('edit', strip_auth=False)
-    def imageset_set_colors(self, bgcolor, color, auth_user=None, session=None):
+    def imageset_set_colors(self, bgcolor, color, expected_version=None, auth_user=None, session=None):
+        version = self._imageset_claim('set_colors', expected_version, session=session)
         self.model_instance.imageset.bgcolor = bgcolor
         self.model_instance.imageset.color = color
         session.add(self.model_instance.imageset)
         session.flush()
         return {'interest_id': self.id,
+                'version': version,
                 'bgcolor': self.model_instance.imageset.bgcolor,
                 'color': self.model_instance.imageset.color}
 
     @with_db
     @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
     @require_permission('read', strip_auth=False)
-    def imageset_get_available_contents(self, auth_user=None, session=None):
-        # TODO Use artefacts instead and filter by label. Presently, files not
-        #  in the current imageset will not be shown. get_interest_artefacts
-        #  should be able to do this. Confirm the frontend isn't relying on
-        #  this in some undocumented way before making the change.
-        contents = self.model_instance.imageset.contents
-        contents = [{x.export()} for x in contents]
+    def imageset_get_available_contents(self, offset=None, limit=None, after=None,
+                                        auth_user=None, session=None):
+        # All imageset files uploaded to this interest, whether or not they
+        # are presently in the imageset.
+        rows, total_count = imageset_get_available(id=self.model_instance.imageset_id,
+                                                   interest_id=self.id,
+                                                   offset=offset, limit=limit, after=after,
+                                                   session=session)
+        contents = [{'storedfile_id': storedfile.id,
+                     'content': storedfile.expose_uri,
+                     'in_set': in_set} for storedfile, in_set in rows]
+
+        next_after = None
+        if limit and len(contents) == limit:
+            next_after = contents[-1]['storedfile_id']
 
         return {'interest_id': self.id,
-                'default_duration': self.model_instance.content.default_duration,
-                'contents': contents}
+                'default_duration': self.model_instance.imageset.default_duration,
+                'contents': contents,
+                'total_count': total_count,
+                'next_after': next_after}
 
     @with_db
     @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
     @require_permission('read', strip_auth=False, required=False)
-    def imageset_get_contents(self, auth_user=None, session=None):
-        contents = self.model_instance.imageset.contents
-        contents = [x.export() for x in contents]
+    def imageset_get_contents(self, offset=None, limit=None, after=None, auth_user=None, session=None):
+        return read_imageset_contents(self.id, self.model_instance.imageset_id,
+                                      offset=offset, limit=limit, after=after,
+                                      session=session)
 
-        return {'interest_id': self.id,
-                'default_duration': self.model_instance.imageset.default_duration,
-                'bgcolor': self.model_instance.imageset.bgcolor,
-                'color': self.model_instance.imageset.color,
-                'contents': contents}
+    @with_db
+    @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
+    @require_permission('read', strip_auth=False, required=False)
+    def imageset_get_timeline(self, t=None, auth_user=None, session=None):
+        return read_imageset_timeline(self.id, self.model_instance.imageset_id,
+                                      t=t, session=session)
+
+    @with_db
+    @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
+    @require_permission('read', strip_auth=False)
+    def imageset_storedfile_usage(self, storedfile_ids, auth_user=None, session=None):
+        # Usage is reported only within this interest's own imageset, the one
+        # the caller is known to be able to read. Imagesets of other interests
+        # which use the same files, such as clones, are not disclosed.
+        rv = imageset_storedfile_references(storedfile_ids, interest_id=self.id,
+                                            imageset_ids=[self.model_instance.imageset_id],
+                                            session=session)
+        foreign = sorted(set(storedfile_ids) - set(rv))
+        if foreign:
+            raise PermissionError(f"StoredFiles {foreign} do not seem to belong to this "
+                                  f"interest {self.id}. Cannot report imageset usage.")
+        return rv
+
+    @with_db
+    @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
+    @require_permission('read', strip_auth=False)
+    def imageset_get_id(self, auth_user=None, session=None):
+        return self.model_instance.imageset_id
 
     @with_db
     @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
     @require_permission('add_artefact', strip_auth=False)
-    def imageset_add(self, storedfile_id, position=None, duration=None, auth_user=None, session=None):
+    def imageset_clone_from(self, source, expected_version=None, background_tasks=None,
+                            auth_user=None, session=None):
+        # Replaces the contents of this imageset with those of the source
+        # interest's imageset. StoredFiles are shared, not copied, so they
+        # continue to belong to the source interest. Cloning into an active
+        # interest publishes the files, so the source must itself be active,
+        # lest content which was never approved goes live.
+        source_imageset_id = source.imageset_get_id(auth_user=auth_user, session=session)
+        if source_imageset_id == self.model_instance.imageset_id:
+            raise ValueError(f"Cannot clone the imageset of interest {self.id} into itself")
+        if self.status == LifecycleStatus.ACTIVE and source.status != LifecycleStatus.ACTIVE:
+            raise InterestStateException(source.status, LifecycleStatus.ACTIVE,
+                                         'imageset_clone_from', source.id, source.name)
+        self._imageset_claim('clone', expected_version, session=session)
+        imageset_clone(source_id=source_imageset_id,
+                       target_id=self.model_instance.imageset_id,
+                       session=session)
+        self._stage_contents(background_tasks=background_tasks, session=session)
+        return True
+
+    @with_db
+    @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
+    @require_permission('add_artefact', strip_auth=False)
+    def imageset_add(self, storedfile_id, position=None, duration=None, media=None, expected_version=None,
+                     auth_user=None, session=None):
         # Get Content and Verify Access
         owner = get_storedfile_owner(storedfile_id, session=session)
         if not owner['interest'].id == self.id:
@@ -243,22 +444,119 @@ class InterestImageSetMixin(InterestMixinBase):
             _duration = self.model_instance.imageset.default_duration
 
         # Create and commit Association Model
+        self._imageset_claim('add', expected_version, session=session)
         imageset_add_content(id=self.model_instance.imageset_id,
                              storedfile=storedfile_id,
                              position=position,
                              duration=duration,
+                             media=media,
                              session=session)
 
         imageset_heal_positions(id=self.model_instance.imageset_id, session=session)
         return True
 
+    @with_db
+    @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
+    @require_permission('add_artefact', strip_auth=False)
+    def imageset_set_item_durations(self, durations=None, by='position', duration=None, scale=None,
+                                    expected_version=None, auth_user=None, session=None):
+        # Exactly one of the forms is expected :
+        #   - durations : mapping of positions or storedfile ids to durations
+        #   - duration  : a single duration applied to every item
+        #   - scale     : a factor by which every item's duration is scaled
+        # Durations of None reset the items to the imageset default.
+        forms = [x for x in (durations, duration, scale) if x is not None]
+        if len(forms) != 1:
+            raise ValueError("Expecting exactly one of durations, duration or scale")
+        for value in list((durations or {}).values()) + [duration]:
+            if value is not None and (not isinstance(value, int) or value <= 0):
+                raise ValueError("Expecting positive integers for durations")
+        if scale is not None and scale <= 0:
+            raise ValueError("Expecting a positive scale factor")
+
+        self._imageset_claim('set_durations', expected_version, session=session)
+        if durations is not None:
+            imageset_set_durations(id=self.model_instance.imageset_id, durations=durations,
+                                   by=by, session=session)
+        elif duration is not None:
+            imageset_set_all_durations(id=self.model_instance.imageset_id,
+                                       duration=duration, session=session)
+        else:
+            imageset_scale_durations(id=self.model_instance.imageset_id,
+                                     factor=scale, session=session)
+        return True
+
+    @with_db
+    @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
+    @require_permission('read', strip_auth=False)
+    def imageset_get_revisions(self, auth_user=None, session=None):
+        revisions = imageset_get_revisions(id=self.model_instance.imageset_id, session=session)
+        return [x.export() for x in revisions]
+
+    @with_db
+    @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
+    @require_permission('edit', strip_auth=False)
+    def imageset_create_revision(self, comment=None, auth_user=None, session=None):
+        revision = imageset_create_revision(id=self.model_instance.imageset_id,
+                                            comment=comment, session=session)
+        return revision.export()
+
+    @with_db
+    @require_state((LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE))
+    @require_permission('edit', strip_auth=False)
+    def imageset_restore_revision(self, revision_id, expected_version=None,
+                                  background_tasks=None, auth_user=None, session=None):
+        self._imageset_claim('restore_revision', expected_version, session=session)
+        imageset_restore_revision(id=self.model_instance.imageset_id,
+                                  revision_id=revision_id, session=session)
+        self._stage_contents(background_tasks=background_tasks, session=session)
+        return True
+
     @with_db
     @require_state((LifecycleStatus.NEW, LifecycleStatus.ACTIVE, LifecycleStatus.APPROVAL))
     @require_permission('add_artefact', strip_auth=False)
-    def imageset_remove(self, position=None, auth_user=None, session=None):
+    def imageset_remove(self, position=None, expected_version=None, auth_user=None, session=None):
+        self._imageset_claim('remove', expected_version, session=session)
         imageset_remove_content(id=self.model_instance.imageset_id,
                                 position=position,
                                 session=session)
         imageset_heal_positions(id=self.model_instance.imageset_id, session=session)
-        # TODO Remove storedfile as well.
+        # The storedfile is left in the filestore. It is reclaimed later by
+        # tendril.structures.imageset.gc once nothing references it.
         return True
+
+    @with_db
+    @require_state((LifecycleStatus.NEW, LifecycleStatus.ACTIVE, LifecycleStatus.APPROVAL))
+    @require_permission('add_artefact', strip_auth=False)
+    def imageset_remove_many(self, positions=None, storedfile_ids=None, start=None, end=None,
+                             cleanup=False, expected_version=None, background_tasks=None,
+                             auth_user=None, session=None):
+        self._imageset_claim('remove', expected_version, session=session)
+        removed = imageset_remove_contents(id=self.model_instance.imageset_id,
+                                           positions=positions, storedfile_ids=storedfile_ids,
+                                           start=start, end=end, session=session)
+        imageset_heal_positions(id=self.model_instance.imageset_id, session=session)
+
+        if cleanup and removed:
+            # The removed files are only unreferenced once this transaction
+            # commits, so cleanup can only run as a background task. Without
+            # one, they are left to the periodic collection.
+            if background_tasks:
+                background_tasks.add_task(self._cleanup_storedfiles, self.id, list(set(removed)))
+        return len(removed)
+
+    @staticmethod
+    async def _cleanup_storedfiles(interest_id, storedfile_ids):
+        # Only files which nothing else references any longer are deleted.
+        # The removal has already been committed and responded to, so
+        # failures are only logged. Anything left behind is picked up by
+        # the periodic collection.
+        try:
+            report = await collect_storedfiles(storedfile_ids=storedfile_ids, min_age=None)
+        except Exception as e:
+            logger.warn(f"Exception while cleaning up removed imageset files "
+                        f"for interest {interest_id} : {e!r}")
+            return
+        if report['failed']:
+            logger.warn(f"Could not clean up {report['failed']} removed imageset files "
+                        f"for interest {interest_id}")
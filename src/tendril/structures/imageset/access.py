@@ -0,0 +1,70 @@
+
+
+"""
+ImageSet Access Cache
+=====================
+
+Read-only imageset routes are polled frequently, and building the full
+interest object on every request only to check its lifecycle state and the
+user's read permission dominates the cost of serving them.
+
+This module caches, per interest, the imageset id and lifecycle state, and
+per interest and user, that the user was allowed to read the imageset. Both
+are only ever populated from a read which went through the interest and its
+access checks, so a cache hit is exactly as permissive as the last such
+read. Denials are never cached.
+
+Entries are dropped by :func:`invalidate` when the interest's lifecycle or
+memberships change in this process. Otherwise they expire after
+``IMAGESET_ACCESS_CACHE_TTL`` seconds. That bounds how long changes made by
+other processes, and membership changes inherited from parent interests,
+take to be seen.
+
+"""
+
+from tendril.common.states import LifecycleStatus
+from tendril.structures.imageset.cache import LRUCache
+
+from tendril.config import IMAGESET_ACCESS_CACHE_TTL
+from tendril.config import IMAGESET_ACCESS_CACHE_SIZE
+
+
+READABLE_STATES = (LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE)
+
+_interests = LRUCache(maxsize=IMAGESET_ACCESS_CACHE_SIZE, ttl=IMAGESET_ACCESS_CACHE_TTL)
+_readers = LRUCache(maxsize=IMAGESET_ACCESS_CACHE_SIZE, ttl=IMAGESET_ACCESS_CACHE_TTL)
+
+
+def resolve_readable(interest_id, user_id):
+    """
+    Returns the imageset id of the interest if it is known to be in a
+    readable state and the user is known to be allowed to read it, or
+    ``None`` if the caller needs to go through the interest instead.
+    """
+    entry = _interests.get(interest_id)
+    if entry is None:
+        return None
+    imageset_id, status = entry
+    if status not in READABLE_STATES or not _readers.get((interest_id, user_id)):
+        return None
+    return imageset_id
+
+
+def remember_readable(interest, user_id):
+    """
+    Record that ``user_id`` has just been allowed to read the imageset of
+    ``interest``. Call only after the interest's own checks have passed.
+    """
+    _interests.set(interest.id, (interest.model_instance.imageset_id,
+                                 interest.model_instance.status))
+    _readers.set((interest.id, user_id), True)
+
+
+def invalidate(interest_id):
+    _interests.invalidate(interest_id)
+    _readers.invalidate_where(lambda k: k[0] == interest_id)
+
+
+def clear():
+    _interests.clear()
+    _readers.clear()
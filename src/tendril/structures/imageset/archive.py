@@ -0,0 +1,172 @@
+
+
+"""
+ImageSet Archives
+=================
+
+Sites with poor connectivity receive imageset content in bulk, as a single
+archive containing every file in the imageset along with a manifest which
+describes the imageset and its playback order.
+
+:func:`stream_archive` produces such an archive as an async stream of
+chunks. Files are fetched from the filestore with a bounded number of
+fetches running ahead of the archive writer, and each file is written out
+and released as soon as it is its turn. Neither the archive nor the full
+set of files is ever held in memory or written to disk.
+
+"""
+
+import io
+import json
+import time
+import asyncio
+import tarfile
+import zipfile
+import posixpath
+from collections import deque
+from urllib.parse import urlsplit
+
+import httpx
+
+from tendril.config import IMAGESET_ARCHIVE_PREFETCH
+from tendril.config import IMAGESET_ARCHIVE_FETCH_TIMEOUT
+
+from tendril.utils import log
+logger = log.get_logger(__name__, log.DEFAULT)
+
+
+MANIFEST_NAME = 'manifest.json'
+
+ARCHIVE_MEDIA_TYPES = {
+    'zip': 'application/zip',
+    'tar': 'application/x-tar',
+}
+
+
+class _Drain(object):
+    # Write-only, unseekable target for the archive writers. Whatever they
+    # write is held here only until it is handed off to the response.
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class _ZipWriter(object):
+    def __init__(self, fileobj):
+        # Imageset files are already compressed, so they are stored as is.
+        self._archive = zipfile.ZipFile(fileobj, mode='w',
+                                        compression=zipfile.ZIP_STORED)
+
+    def add(self, name, data, mtime):
+        zinfo = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+        self._archive.writestr(zinfo, data)
+
+    def close(self):
+        self._archive.close()
+
+
+class _TarWriter(object):
+    def __init__(self, fileobj):
+        self._archive = tarfile.open(fileobj=fileobj, mode='w|')
+
+    def add(self, name, data, mtime):
+        tinfo = tarfile.TarInfo(name)
+        tinfo.size = len(data)
+        tinfo.mtime = int(mtime)
+        self._archive.addfile(tinfo, io.BytesIO(data))
+
+    def close(self):
+        self._archive.close()
+
+
+_writers = {
+    'zip': _ZipWriter,
+    'tar': _TarWriter,
+}
+
+
+def archive_manifest(imageset):
+    """
+    Build the archive manifest from the full imageset contents, as returned
+    by ``imageset_get_contents``. Each item is annotated with the name of
+    its file within the archive.
+
+    Returns the manifest and the list of ``(name, uri)`` entries to fetch,
+    in playback order.
+    """
+    manifest = {k: v for k, v in imageset.items() if k not in ('contents', 'next_after')}
+    manifest['contents'] = []
+    entries = []
+    width = len(str(len(imageset['contents'])))
+    for idx, item in enumerate(imageset['contents']):
+        basename = posixpath.basename(urlsplit(item['content']).path)
+        name = f"{idx:0{width}d}-{basename}"
+        manifest['contents'].append(dict(item, file=name))
+        entries.append((name, item['content']))
+    return manifest, entries
+
+
+async def _fetch(client, uri):
+    response = await client.get(uri)
+    response.raise_for_status()
+    return response.content
+
+
+async def stream_archive(entries, manifest, format='zip',
+                         prefetch=IMAGESET_ARCHIVE_PREFETCH,
+                         timeout=IMAGESET_ARCHIVE_FETCH_TIMEOUT):
+    """
+    Stream an archive of the given ``(name, uri)`` entries, preceded by the
+    manifest. At most ``prefetch`` files are fetched ahead of the writer.
+
+    If a file cannot be fetched, the error is logged and the stream ends
+    without the archive being closed, so the client sees a truncated
+    archive rather than one which is silently missing files.
+    """
+    drain = _Drain()
+    writer = _writers[format](drain)
+    mtime = time.time()
+
+    writer.add(MANIFEST_NAME, json.dumps(manifest, indent=2).encode(), mtime)
+    yield drain.drain()
+
+    entries = iter(entries)
+    pending = deque()
+
+    async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+        def _schedule():
+            for name, uri in entries:
+                pending.append((name, uri, asyncio.ensure_future(_fetch(client, uri))))
+                return
+
+        try:
+            for _ in range(max(prefetch, 1)):
+                _schedule()
+            while pending:
+                name, uri, task = pending.popleft()
+                try:
+                    data = await task
+                except httpx.HTTPError as e:
+                    logger.error(f"Could not fetch {uri} for imageset archive : {e}")
+                    raise
+                _schedule()
+                writer.add(name, data, mtime)
+                del data
+                yield drain.drain()
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+    writer.close()
+    yield drain.drain()
@@ -0,0 +1,190 @@
+
+
+"""
+ImageSet Orphaned File Collection
+=================================
+
+Removing content from an imageset only removes the association. The
+underlying StoredFile remains in whichever filestore bucket it was in.
+The functions here find StoredFiles labelled ``imageset`` which are no
+longer referenced by any imageset and delete them from the filestore.
+
+Unreferenced files of interests which are still live make up the library
+the interest can add content back from, so the periodic collection leaves
+them alone. It only reclaims files of interests which are no longer live.
+Files explicitly handed over for cleanup, such as those removed with
+``cleanup``, are deleted whatever the state of their interest.
+
+Collection is done in batches, with bounded concurrency and an optional
+rate limit, so it can be run against large live deployments. A dry run
+reports what would be reclaimed without deleting anything. Remote buckets
+do not support deletion, so files in them, or in buckets not available to
+this component, are skipped with a single warning for each bucket. Files
+which fail to delete are logged. Both are counted in the report.
+
+This can be run as a module :
+
+    python -m tendril.structures.imageset.gc [--dry-run]
+
+"""
+
+import time
+import asyncio
+import inspect
+import argparse
+from httpx import HTTPStatusError
+
+from tendril.filestore import buckets
+from tendril.filestore.remote import FilestoreBucketRemote
+from tendril.common.states import LifecycleStatus
+from tendril.structures.imageset.threads import run_sync
+from tendril.config import IMAGESET_GC_BATCH_SIZE
+from tendril.config import IMAGESET_GC_CONCURRENCY
+from tendril.config import IMAGESET_GC_RATE_LIMIT
+from tendril.config import IMAGESET_GC_GRACE_PERIOD
+
+from tendril.db.controllers.imageset import imageset_orphaned_storedfiles
+from tendril.db.controllers.imageset import imageset_storedfile_owners
+from tendril.utils.db import get_session
+from tendril.utils import log
+logger = log.get_logger(__name__, log.DEFAULT)
+
+
+# Interests in these states keep their unreferenced files as their library.
+LIBRARY_STATES = (LifecycleStatus.NEW, LifecycleStatus.APPROVAL, LifecycleStatus.ACTIVE)
+
+
+def _storedfile_size(storedfile):
+    fileinfo = storedfile.fileinfo or {}
+    return (fileinfo.get('props') or {}).get('size', 0) or 0
+
+
+def _fetch_batch(storedfile_ids, min_age, after, limit):
+    exclude_states = LIBRARY_STATES if storedfile_ids is None else None
+    with get_session() as session:
+        candidates = imageset_orphaned_storedfiles(storedfile_ids=storedfile_ids,
+                                                   min_age=min_age, exclude_states=exclude_states,
+                                                   after=after, limit=limit, session=session)
+        owners = imageset_storedfile_owners([x.id for x in candidates], session=session)
+        return [(x.id, x.bucket.name, x.filename, owners.get(x.id), _storedfile_size(x))
+                for x in candidates]
+
+
+def _can_delete(bucket_name, checked):
+    # Each bucket is checked once per collection. Those which cannot delete
+    # from here are reported once and their files skipped, rather than
+    # failing every file in them.
+    if bucket_name not in checked:
+        try:
+            bucket = buckets.get_bucket(bucket_name)
+        except KeyError:
+            reason = "is not available on this component"
+        else:
+            reason = None
+            if isinstance(bucket, FilestoreBucketRemote):
+                reason = "is a remote bucket, which does not support deletion"
+        if reason:
+            logger.warn(f"Skipping orphaned imageset files in the {bucket_name} bucket : it {reason}")
+        checked[bucket_name] = reason is None
+    return checked[bucket_name]
+
+
+async def _delete_file(bucket, filename, user):
+    # Local buckets delete synchronously, with their own database session,
+    # and are run in a worker thread. Remote buckets are async. Files are
+    # deleted on behalf of their owner, which satisfies the ownership check
+    # buckets make when they do not otherwise allow deletion.
+    if inspect.iscoroutinefunction(bucket.delete):
+        await bucket.delete(filename, user=user)
+    else:
+        await run_sync(bucket.delete, filename, user=user)
+
+
+async def _delete(candidate, semaphore, report):
+    storedfile_id, bucket_name, filename, owner, size = candidate
+    async with semaphore:
+        try:
+            await _delete_file(buckets.get_bucket(bucket_name), filename, owner)
+        except HTTPStatusError as e:
+            logger.warn(f"Could not delete orphaned imageset file {filename} "
+                        f"from {bucket_name} : HTTP {e.response.status_code} {e.response.text}")
+            report['failed'] += 1
+            return
+        except Exception as e:
+            logger.warn(f"Could not delete orphaned imageset file {filename} "
+                        f"from {bucket_name} : {e!r}")
+            report['failed'] += 1
+            return
+    report['deleted'] += 1
+    report['bytes_reclaimed'] += size
+
+
+async def collect_storedfiles(storedfile_ids=None, dry_run=False,
+                              batch_size=IMAGESET_GC_BATCH_SIZE,
+                              concurrency=IMAGESET_GC_CONCURRENCY,
+                              rate_limit=IMAGESET_GC_RATE_LIMIT,
+                              min_age=IMAGESET_GC_GRACE_PERIOD):
+    """
+    Delete orphaned imageset files from the filestore.
+
+    If ``storedfile_ids`` is provided, only those StoredFiles are considered,
+    and they are deleted only if nothing references them any longer. Otherwise,
+    all orphaned imageset files older than ``min_age`` seconds are collected,
+    except those of interests in one of the ``LIBRARY_STATES``.
+
+    Returns a report of the number of candidates found, files deleted, files
+    skipped because their bucket cannot delete them, files which failed to
+    delete and the bytes reclaimed. A file which fails to delete is logged
+    and counted, and does not stop the collection.
+    """
+    report = {'dry_run': dry_run, 'candidates': 0, 'deleted': 0, 'skipped': 0,
+              'failed': 0, 'bytes_reclaimed': 0}
+    semaphore = asyncio.Semaphore(concurrency)
+    checked = {}
+    after = None
+
+    while True:
+        batch = await run_sync(_fetch_batch, storedfile_ids, min_age, after, batch_size)
+        if not batch:
+            break
+        after = batch[-1][0]
+        report['candidates'] += len(batch)
+        deletable = [x for x in batch if _can_delete(x[1], checked)]
+        report['skipped'] += len(batch) - len(deletable)
+
+        if dry_run:
+            for _, bucket_name, filename, _, size in deletable:
+                logger.info(f"Would delete orphaned imageset file {filename} from {bucket_name}")
+                report['bytes_reclaimed'] += size
+            continue
+
+        started = time.monotonic()
+        await asyncio.gather(*[_delete(x, semaphore, report)
+                               for x in deletable])
+        if rate_limit:
+            remaining = len(deletable) / rate_limit - (time.monotonic() - started)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+
+    logger.info(f"Imageset garbage collection complete : {report}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect orphaned imageset files from the filestore.")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Report what would be deleted without deleting anything.")
+    parser.add_argument('--batch-size', type=int, default=IMAGESET_GC_BATCH_SIZE)
+    parser.add_argument('--concurrency', type=int, default=IMAGESET_GC_CONCURRENCY)
+    parser.add_argument('--rate-limit', type=float, default=IMAGESET_GC_RATE_LIMIT,
+                        help="Maximum deletions per second. 0 to disable.")
+    args = parser.parse_args()
+    report = asyncio.run(collect_storedfiles(dry_run=args.dry_run,
+                                             batch_size=args.batch_size,
+                                             concurrency=args.concurrency,
+                                             rate_limit=args.rate_limit))
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
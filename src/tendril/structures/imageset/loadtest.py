@@ -0,0 +1,390 @@
+
+
+"""
+ImageSet API Load Testing
+=========================
+
+Runs the imageset API routes of an interest library in-process, against a
+SQLite database, with the filestore and the token cache replaced by
+in-memory stand-ins, and drives a concurrent mix of uploads, token polls,
+adds and removes against them. Throughput and latency percentiles are
+reported for each operation.
+
+The stand-ins are :
+
+  - :class:`MemoryBucket`, installed for the upload and publish buckets,
+    which keeps file contents in memory and maintains the StoredFile rows
+    the way the filestore would.
+  - :class:`MemoryTokenStore`, installed in place of the redis connection
+    used by :mod:`tendril.caching.tokens`.
+  - A ``get_storedfile_owner`` which resolves the owning interest directly
+    from the StoredFile row.
+
+Authentication is bypassed by overriding the authn dependency with the
+user returned by the setup function. The setup function is given the
+library and a database session, and must create an interest the user can
+edit, returning its id and the user. For example :
+
+    python -m tendril.structures.imageset.loadtest \\
+        mypackage.libraries.signage mypackage.loadtest.setup \\
+        --concurrency 16 --requests 2000 --mix upload=1,poll=4,add=2,remove=1
+
+Latencies are measured through an in-process ASGI transport, so they
+exclude the network. Uploads return once the file is queued. Processing
+runs on the :class:`~tendril.structures.imageset.workers.UploadQueue`
+worker threads, and its progress shows up in the token polls. Uploads
+refused with a 503 because the queue is full are counted as errors. Bulk
+duration changes use SQL which SQLite does not support, and are not part
+of the mix.
+
+The stand-ins replace module state of the database, filestore and token
+cache packages. They are only installed when run as a module, so importing
+this module has no such side effects.
+
+"""
+
+import io
+import time
+import uuid
+import zlib
+import struct
+import random
+import asyncio
+import argparse
+import tempfile
+import importlib
+import threading
+from types import SimpleNamespace
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.dialects.postgresql import JSONB
+
+from tendril.utils import db
+from tendril.caching import tokens
+from tendril.caching.tokens import TokenStatus
+from tendril.filestore import buckets
+from tendril.filestore.db.model import FilestoreBucketModel
+from tendril.filestore.db.model import StoredFileModel
+from tendril.authn.users import authn_dependency
+from tendril.authn.db.controller import preprocess_user
+from tendril.interests.mixins import imageset as imageset_mixin
+from tendril.apiserver.templates.imageset import InterestImageSetRouterGenerator
+from tendril.config import IMAGESET_UPLOAD_FILESTORE_BUCKET
+from tendril.config import IMAGESET_PUBLISHING_FILESTORE_BUCKET
+
+from tendril.utils import log
+logger = log.get_logger(__name__, log.DEFAULT)
+
+
+OPERATIONS = ('upload', 'poll', 'add', 'remove')
+
+
+def _compile_jsonb_sqlite(type_, compiler, **kw):
+    return 'JSON'
+
+
+class MemoryTokenStore(object):
+    # The subset of the redis client interface used by tendril.caching.tokens
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def set(self, key, value, ex=None):
+        expires = time.monotonic() + ex if ex else None
+        with self._lock:
+            self._data[key] = (value, expires)
+        return True
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (None, None))
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class MemoryBucket(object):
+    def __init__(self, name):
+        self.name = name
+        self.expose_uri = f'http://filestore.invalid/{name}/'
+        self._files = {}
+
+    def _bucket_id(self, session):
+        return session.query(FilestoreBucketModel.id).filter_by(name=self.name).scalar()
+
+    def _get_storedfile(self, filename, session):
+        q = session.query(StoredFileModel)
+        q = q.filter_by(filename=filename, bucket_id=self._bucket_id(session))
+        return q.one()
+
+    async def upload(self, file, actual_user=None, interest=None, label=None, overwrite=False):
+        filename, fileobj = file
+        content = fileobj.read()
+        with db.get_session() as session:
+            storedfile = StoredFileModel(filename=filename,
+                                         bucket_id=self._bucket_id(session),
+                                         fileinfo={'props': {'size': len(content)}},
+                                         user_id=preprocess_user(actual_user, session=session),
+                                         interest_id=interest,
+                                         type='stored_file',
+                                         label=label)
+            session.add(storedfile)
+            session.flush()
+            storedfile_id = storedfile.id
+        self._files[filename] = content
+        return {'storedfileid': storedfile_id, 'filename': filename}
+
+    async def move(self, filename, target_bucket, actual_user=None, overwrite=False):
+        target = buckets.get_bucket(target_bucket)
+        with db.get_session() as session:
+            storedfile = self._get_storedfile(filename, session)
+            storedfile.bucket_id = target._bucket_id(session)
+        target._files[filename] = self._files.pop(filename, None)
+        return {'filename': filename, 'bucket': target_bucket}
+
+    @db.with_db
+    def delete(self, filename, user, session=None):
+        # Synchronous, as on local filestore buckets. Remote buckets do not
+        # support deletion at all.
+        session.delete(self._get_storedfile(filename, session))
+        self._files.pop(filename, None)
+
+
+def _get_storedfile_owner(id=None, session=None):
+    interest_id = session.get(StoredFileModel, id).interest_id
+    return {'interest': SimpleNamespace(id=interest_id)}
+
+
+def _install_standins(database):
+    # Binds the database sessions to the database, creates the schema for
+    # all models imported so far, and replaces the filestore buckets, the
+    # token cache and the StoredFile owner lookup with the stand-ins.
+    compiles(JSONB, 'sqlite')(_compile_jsonb_sqlite)
+    engine = create_engine(database,
+                           json_serializer=db.dumps,
+                           json_deserializer=db.loads,
+                           connect_args={'check_same_thread': False,
+                                         'timeout': 30})
+    db.engine = engine
+    db.Session.configure(bind=engine)
+    db.DeclBase.metadata.create_all(engine)
+
+    tokens.redis_connection = MemoryTokenStore()
+    imageset_mixin.get_storedfile_owner = _get_storedfile_owner
+
+    with db.get_session() as session:
+        for name in {IMAGESET_UPLOAD_FILESTORE_BUCKET, IMAGESET_PUBLISHING_FILESTORE_BUCKET}:
+            if not session.query(FilestoreBucketModel).filter_by(name=name).count():
+                session.add(FilestoreBucketModel(name=name))
+            buckets._available_buckets[name] = MemoryBucket(name)
+
+
+def build_app(library, name, user):
+    app = FastAPI()
+    for router in InterestImageSetRouterGenerator(library).generate(name):
+        app.include_router(router)
+
+    # Stands in for the tokens API of the caching component.
+    @app.get("/tokens/{namespace}/{key}")
+    async def get_token(namespace: str, key: str):
+        return tokens.read(namespace=namespace, key=key)
+
+    app.dependency_overrides[authn_dependency] = lambda: user
+    return app
+
+
+def _png(width=64, height=64):
+    def _chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + \
+            struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    rows = b''.join(b'\x00' + bytes([random.randrange(256)] * 3 * width)
+                    for _ in range(height))
+    return b'\x89PNG\r\n\x1a\n' + \
+        _chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) + \
+        _chunk(b'IDAT', zlib.compress(rows)) + \
+        _chunk(b'IEND', b'')
+
+
+class _LoadState(object):
+    def __init__(self):
+        self.token_ids = []
+        self.storedfile_ids = []
+        self.item_count = 0
+
+
+async def _upload(client, base, state):
+    response = await client.post(f'{base}/upload', files={
+        'file': (f'is_{uuid.uuid1()}.png', io.BytesIO(_png()), 'image/png')
+    })
+    if response.status_code == 200:
+        state.token_ids.append(response.json()['id'])
+    return response
+
+
+async def _poll(client, base, state):
+    if not state.token_ids:
+        return await client.get(base)
+    token_id = random.choice(state.token_ids)
+    response = await client.get(f'/tokens/isu/{token_id}')
+    if response.status_code == 200:
+        token = response.json() or {}
+        storedfile_id = (token.get('metadata') or {}).get('storedfile_id')
+        if token.get('state') == TokenStatus.CLOSED.value and storedfile_id:
+            state.token_ids.remove(token_id)
+            state.storedfile_ids.append(storedfile_id)
+    return response
+
+
+async def _add(client, base, state):
+    if not state.storedfile_ids:
+        return await _upload(client, base, state)
+    response = await client.post(f'{base}/add', json={
+        'storedfile_id': random.choice(state.storedfile_ids)
+    })
+    if response.status_code == 200:
+        state.item_count = response.json()['total_count']
+    return response
+
+
+async def _remove(client, base, state):
+    if not state.item_count:
+        response = await client.get(base)
+    else:
+        response = await client.post(f'{base}/remove/{random.randrange(state.item_count)}')
+    if response.status_code == 200:
+        state.item_count = response.json()['total_count']
+    return response
+
+
+_operations = {
+    'upload': _upload,
+    'poll': _poll,
+    'add': _add,
+    'remove': _remove,
+}
+
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def summarize(samples, elapsed):
+    report = {}
+    for operation in OPERATIONS:
+        latencies = sorted(x[2] for x in samples if x[0] == operation)
+        if not latencies:
+            continue
+        report[operation] = {
+            'count': len(latencies),
+            'errors': len([x for x in samples if x[0] == operation and x[1] >= 400]),
+            'throughput': len(latencies) / elapsed,
+            'p50': _percentile(latencies, 50) * 1000,
+            'p90': _percentile(latencies, 90) * 1000,
+            'p99': _percentile(latencies, 99) * 1000,
+            'max': latencies[-1] * 1000,
+        }
+    return report
+
+
+async def run_load(app, base, mix, concurrency=8, requests=1000, duration=None):
+    """
+    Drive a weighted mix of operations against the app with ``concurrency``
+    concurrent clients, until ``requests`` operations have been issued or
+    ``duration`` seconds have passed. Returns the per-operation report.
+    """
+    state = _LoadState()
+    samples = []
+    operations = list(mix.keys())
+    weights = [mix[x] for x in operations]
+    remaining = [requests]
+    deadline = time.monotonic() + duration if duration else None
+
+    async def _worker(client):
+        while remaining[0] > 0 and (deadline is None or time.monotonic() < deadline):
+            remaining[0] -= 1
+            operation = random.choices(operations, weights)[0]
+            started = time.monotonic()
+            try:
+                response = await _operations[operation](client, base, state)
+                status = response.status_code
+            except Exception as e:
+                logger.warning(f"Load test {operation} failed : {e}")
+                status = 599
+            samples.append((operation, status, time.monotonic() - started))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://loadtest',
+                                 timeout=None) as client:
+        started = time.monotonic()
+        await asyncio.gather(*[_worker(client) for _ in range(concurrency)])
+        elapsed = time.monotonic() - started
+    return summarize(samples, elapsed)
+
+
+def _import(dotted_path):
+    module_name, _, attr = dotted_path.rpartition('.')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def _parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        operation, _, weight = part.partition('=')
+        if operation not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{operation}'")
+        mix[operation] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the imageset API of an interest library.")
+    parser.add_argument('library', help="Dotted path to the interest library instance.")
+    parser.add_argument('setup', help="Dotted path to a function which is called with the library "
+                                      "and a database session, and returns the id of an interest "
+                                      "to test against and the user to test as.")
+    parser.add_argument('--name', default='interests',
+                        help="Name under which the library routes are mounted.")
+    parser.add_argument('--database', default=None,
+                        help="SQLite database URI. Defaults to a new temporary database.")
+    parser.add_argument('--mix', type=_parse_mix, default='upload=1,poll=4,add=2,remove=1',
+                        help="Weighted mix of operations.")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=None,
+                        help="Maximum duration of the run, in seconds.")
+    args = parser.parse_args()
+
+    # The library is imported first so that its models are known when the
+    # schema is created.
+    library = _import(args.library)
+
+    database = args.database
+    if not database:
+        database = f'sqlite:///{tempfile.mkdtemp()}/imageset-loadtest.db'
+    _install_standins(database)
+
+    with db.get_session() as session:
+        interest_id, user = _import(args.setup)(library, session)
+
+    app = build_app(library, args.name, user)
+    report = asyncio.run(run_load(app, f'/{args.name}/{interest_id}/imageset', args.mix,
+                                  concurrency=args.concurrency, requests=args.requests,
+                                  duration=args.duration))
+
+    print(f"{'operation':<10}{'count':>8}{'errors':>8}{'req/s':>10}"
+          f"{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for operation, r in report.items():
+        print(f"{operation:<10}{r['count']:>8}{r['errors']:>8}{r['throughput']:>10.1f}"
+              f"{r['p50']:>10.1f}{r['p90']:>10.1f}{r['p99']:>10.1f}{r['max']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+
+
+"""
+ImageSet Upload Progress Reporting
+==================================
+
+Each update to a progress token is a round trip to the caching backend.
+:class:`TokenReporter` merges progress updates which arrive within a short
+window of the last write into a single update. State transitions and errors
+are always written immediately, along with anything pending.
+
+"""
+
+import time
+
+from tendril.caching import tokens
+from tendril.config import IMAGESET_TOKEN_UPDATE_WINDOW
+
+
+class TokenReporter(object):
+    def __init__(self, namespace, token_id, window=IMAGESET_TOKEN_UPDATE_WINDOW):
+        self.namespace = namespace
+        self.token_id = token_id
+        self.window = window
+        self._pending = {}
+        self._last_sent = None
+
+    def update(self, state=None, error=None, metadata=None, **kwargs):
+        if not self.token_id:
+            return
+        self._pending.update(kwargs)
+        if metadata:
+            self._pending.setdefault('metadata', {}).update(metadata)
+        if state is not None:
+            self._pending['state'] = state
+        if error is not None:
+            self._pending['error'] = error
+
+        if state is not None or error is not None or \
+                self._last_sent is None or \
+                time.monotonic() - self._last_sent >= self.window:
+            self.flush()
+
+    def flush(self):
+        if not self.token_id or not self._pending:
+            return
+        tokens.update(self.namespace, self.token_id, **self._pending)
+        self._pending = {}
+        self._last_sent = time.monotonic()
+
+    def close(self):
+        if not self.token_id:
+            return
+        self.flush()
+        tokens.close(self.namespace, self.token_id)
@@ -0,0 +1,175 @@
+
+
+"""
+ImageSet Upload Content Sniffing
+================================
+
+Cheap checks on the first bytes of an uploaded file, used to reject
+mislabelled or oversized uploads before any expensive processing is done.
+Only the file header is read. The file position is restored afterwards.
+
+:class:`MultipartFileHead` extracts the file name and header of an upload
+from a multipart body as it is received, so that these checks can also be
+made before the rest of the upload is received.
+
+"""
+
+import struct
+from email.message import Message
+
+
+SNIFF_LENGTH = 128 * 1024
+
+# Allowance for the form fields and part headers ahead of the file itself.
+_MULTIPART_PREAMBLE = 16 * 1024
+
+_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'%PDF-', '.pdf'),
+]
+
+_EXTENSION_ALIASES = {
+    '.jpeg': '.jpg',
+}
+
+# JPEG Start Of Frame markers. C4, C8 and CC are not frame headers.
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def normalize_extension(ext):
+    ext = ext.lower()
+    return _EXTENSION_ALIASES.get(ext, ext)
+
+
+def known_extensions():
+    return {x[1] for x in _SIGNATURES} | set(_EXTENSION_ALIASES.keys())
+
+
+def sniff_type(head):
+    for signature, ext in _SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+
+def _png_dimensions(head):
+    if len(head) < 24 or head[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', head[16:24])
+
+
+def _jpeg_dimensions(head):
+    idx = 2
+    while idx + 9 < len(head):
+        if head[idx] != 0xFF:
+            return None
+        marker = head[idx + 1]
+        if marker == 0xFF:
+            idx += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            idx += 2
+            continue
+        length = struct.unpack('>H', head[idx + 2:idx + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', head[idx + 5:idx + 9])
+            return width, height
+        idx += 2 + length
+    return None
+
+
+def sniff(fileobj):
+    """
+    Identify the type and, for images, the pixel dimensions of a file from
+    its header. Returns a dict with ``ext``, ``width`` and ``height``. Any
+    of these may be None if they could not be determined from the header.
+    """
+    position = fileobj.tell()
+    head = fileobj.read(SNIFF_LENGTH)
+    fileobj.seek(position)
+    return sniff_head(head)
+
+
+def sniff_head(head):
+    ext = sniff_type(head)
+    dimensions = None
+    if ext == '.png':
+        dimensions = _png_dimensions(head)
+    elif ext == '.jpg':
+        dimensions = _jpeg_dimensions(head)
+
+    width, height = dimensions or (None, None)
+    return {'ext': ext, 'width': width, 'height': height}
+
+
+def multipart_boundary(content_type):
+    if not content_type:
+        return None
+    msg = Message()
+    msg['content-type'] = content_type
+    if msg.get_content_type() != 'multipart/form-data':
+        return None
+    boundary = msg.get_param('boundary')
+    return boundary.encode('latin-1') if boundary else None
+
+
+class MultipartFileHead(object):
+    """
+    Collects the file name and the first ``length`` bytes of the first file
+    in a ``multipart/form-data`` body, fed to it in chunks as received.
+
+    :meth:`feed` returns True once it is done, after which ``filename`` and
+    ``head`` are set if a file part was found. It gives up, leaving both as
+    None, if the file part does not start near the beginning of the body.
+    """
+    def __init__(self, boundary, length=SNIFF_LENGTH):
+        self._delimiter = b'\r\n--' + boundary
+        self._length = length
+        # The leading CRLF makes the first delimiter look like the others.
+        self._buffer = b'\r\n'
+        self._start = None
+        self.filename = None
+        self.head = None
+        self.done = False
+
+    def _find_file_part(self):
+        idx = 0
+        while True:
+            part = self._buffer.find(self._delimiter, idx)
+            if part < 0:
+                return False
+            headers_end = self._buffer.find(b'\r\n\r\n', part)
+            if headers_end < 0:
+                return False
+            msg = Message()
+            for line in self._buffer[part + len(self._delimiter):headers_end].split(b'\r\n'):
+                name, sep, value = line.decode('latin-1').partition(':')
+                if sep:
+                    msg[name.strip()] = value.strip()
+            filename = msg.get_filename()
+            if filename is not None:
+                self.filename = filename
+                self._start = headers_end + 4
+                return True
+            idx = headers_end + 4
+
+    def feed(self, data, more_body=True):
+        if self.done:
+            return True
+        self._buffer += data
+        if self._start is None and not self._find_file_part():
+            if len(self._buffer) > _MULTIPART_PREAMBLE or not more_body:
+                self._buffer = b''
+                self.done = True
+            return self.done
+        content = self._buffer[self._start:]
+        end = content.find(self._delimiter)
+        if end >= 0:
+            content = content[:end]
+        elif len(content) < self._length and more_body:
+            return False
+        self.head = content[:self._length]
+        self._buffer = b''
+        self.done = True
+        return True
@@ -0,0 +1,221 @@
+
+
+"""
+ImageSet Resumable Upload Spool
+===============================
+
+Local storage for imageset uploads which are received in chunks over
+several requests. Each upload is identified by its upload token id and
+consists of a data file, which grows as chunks are received, and a small
+JSON sidecar holding what is needed to finalize the upload.
+
+The size of the data file is the authoritative record of how much of the
+upload has been received, so a client can always resume from it.
+
+Once finalized, the upload is marked as such in the sidecar and no longer
+accepts chunks. Writes and finalization hold a lock on the data file, so a
+chunk is never written while the upload is being finalized. The sidecar is
+kept after the upload is processed, so that a repeated finalization can be
+answered, until it is purged along with other stale uploads.
+
+"""
+
+import os
+import re
+import json
+import time
+import fcntl
+import anyio
+from contextlib import contextmanager
+from anyio import to_thread
+
+from tendril.config import IMAGESET_UPLOAD_SPOOL_DIR
+from tendril.config import IMAGESET_RESUMABLE_UPLOAD_TTL
+
+
+_UPLOAD_ID_PATTERN = re.compile(r'^[A-Za-z0-9_\-]+$')
+
+
+class SpoolOffsetMismatch(Exception):
+    def __init__(self, expected, received):
+        self.expected = expected
+        self.received = received
+
+    def __str__(self):
+        return f"Chunk offset {self.received} is past the end of the received " \
+               f"data. Resume from offset {self.expected}."
+
+
+class SpoolSizeExceeded(Exception):
+    def __init__(self, size):
+        self.size = size
+
+    def __str__(self):
+        return f"Chunk extends past the declared upload size of {self.size} bytes."
+
+
+class SpoolFinalized(Exception):
+    def __str__(self):
+        return "Upload has already been finalized and accepts no further chunks."
+
+
+class ResumableUpload(object):
+    def __init__(self, upload_id):
+        if not _UPLOAD_ID_PATTERN.match(str(upload_id)):
+            raise ValueError(f"Invalid upload id {upload_id}")
+        self.upload_id = str(upload_id)
+        self._meta = None
+
+    @property
+    def data_path(self):
+        return os.path.join(IMAGESET_UPLOAD_SPOOL_DIR, f'{self.upload_id}.part')
+
+    @property
+    def meta_path(self):
+        return os.path.join(IMAGESET_UPLOAD_SPOOL_DIR, f'{self.upload_id}.json')
+
+    @classmethod
+    def create(cls, upload_id, interest_id, user_id, filename, storage_filename, size):
+        purge_stale()
+        os.makedirs(IMAGESET_UPLOAD_SPOOL_DIR, exist_ok=True)
+        upload = cls(upload_id)
+        upload._meta = {'interest_id': interest_id,
+                        'user_id': user_id,
+                        'filename': filename,
+                        'storage_filename': storage_filename,
+                        'size': size}
+        open(upload.data_path, 'wb').close()
+        upload._save_meta()
+        return upload
+
+    def _save_meta(self):
+        # Replaced atomically, so it is never read half written.
+        partial_path = f'{self.meta_path}.tmp'
+        with open(partial_path, 'w') as f:
+            json.dump(self._meta, f)
+        os.replace(partial_path, self.meta_path)
+
+    def _load_meta(self):
+        with open(self.meta_path, 'r') as f:
+            self._meta = json.load(f)
+        return self._meta
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            self._load_meta()
+        return self._meta
+
+    @contextmanager
+    def _locked(self):
+        # Held while chunks are written and while the upload is finalized.
+        # The sidecar is reloaded, since another worker may have changed it.
+        with open(self.data_path, 'rb') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            self._load_meta()
+            yield
+
+    def exists(self):
+        # Processed uploads keep only their sidecar.
+        return os.path.exists(self.meta_path) and \
+            (self.finalized or os.path.exists(self.data_path))
+
+    @property
+    def finalized(self):
+        return self.meta.get('finalized', False)
+
+    @property
+    def offset(self):
+        if not os.path.exists(self.data_path) and self.finalized:
+            return self.meta['size']
+        return os.path.getsize(self.data_path)
+
+    @property
+    def complete(self):
+        return self.offset == self.meta['size']
+
+    def finalize(self):
+        """
+        Mark the upload as finalized. Returns False if it already was, in
+        which case the caller should not process it again.
+        """
+        with self._locked():
+            if self.finalized:
+                return False
+            self._meta['finalized'] = True
+            self._save_meta()
+            return True
+
+    def reopen(self):
+        """
+        Undo :meth:`finalize` for an upload which could not be processed,
+        so it can be finalized again. Does nothing if it is already gone.
+        """
+        try:
+            with self._locked():
+                self._meta['finalized'] = False
+                self._save_meta()
+        except FileNotFoundError:
+            pass
+
+    async def write(self, offset, stream):
+        """
+        Write the chunk provided by the async iterable ``stream`` at
+        ``offset``. The offset may be at or before the end of the data
+        already received, allowing a client to resend a chunk it is unsure
+        about. Returns the new offset.
+
+        All file access is done in worker threads, so the event loop is not
+        blocked on disk while the chunk is received.
+        """
+        try:
+            f = await anyio.open_file(self.data_path, 'r+b')
+        except FileNotFoundError:
+            raise SpoolFinalized()
+        async with f:
+            await to_thread.run_sync(fcntl.flock, f.wrapped.fileno(), fcntl.LOCK_EX)
+            meta = await to_thread.run_sync(self._load_meta)
+            if meta.get('finalized'):
+                raise SpoolFinalized()
+            current = await to_thread.run_sync(os.path.getsize, self.data_path)
+            if offset > current:
+                raise SpoolOffsetMismatch(current, offset)
+            position = offset
+            await f.seek(offset)
+            async for chunk in stream:
+                if position + len(chunk) > meta['size']:
+                    raise SpoolSizeExceeded(meta['size'])
+                await f.write(chunk)
+                position += len(chunk)
+            await f.flush()
+        return await to_thread.run_sync(os.path.getsize, self.data_path)
+
+    def open(self):
+        return open(self.data_path, 'rb')
+
+    def release(self):
+        # Removes the received data once it has been processed, keeping the
+        # finalized sidecar.
+        if os.path.exists(self.data_path):
+            os.remove(self.data_path)
+
+    def discard(self):
+        for path in (self.data_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def purge_stale(max_age=IMAGESET_RESUMABLE_UPLOAD_TTL):
+    if not os.path.isdir(IMAGESET_UPLOAD_SPOOL_DIR):
+        return
+    cutoff = time.time() - max_age
+    for entry in os.scandir(IMAGESET_UPLOAD_SPOOL_DIR):
+        upload_id, ext = os.path.splitext(entry.name)
+        if ext == '.json':
+            # Sidecars of processed uploads, which have no data file left.
+            if os.path.exists(os.path.join(IMAGESET_UPLOAD_SPOOL_DIR, f'{upload_id}.part')):
+                continue
+        elif ext != '.part':
+            continue
+        if entry.stat().st_mtime < cutoff:
+            ResumableUpload(upload_id).discard()
@@ -0,0 +1,41 @@
+
+
+"""
+ImageSet Worker Threads
+=======================
+
+The imageset API handlers are async, but the database controllers and the
+interest machinery they use are synchronous. :func:`run_sync` runs such
+work in a worker thread so that the event loop remains free to serve other
+requests. The number of threads used for this is bounded separately from
+the server's default threadpool, by ``IMAGESET_DB_THREADPOOL_SIZE``.
+
+A limiter belongs to the event loop it is used in. Interest code which goes
+through ``async_to_sync`` runs in event loops of its own, so each event loop
+gets its own limiter, created the first time it is needed.
+
+"""
+
+import asyncio
+import weakref
+import functools
+from anyio import to_thread
+from anyio import CapacityLimiter
+
+from tendril.config import IMAGESET_DB_THREADPOOL_SIZE
+
+
+_limiters = weakref.WeakKeyDictionary()
+
+
+def _get_limiter():
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        limiter = _limiters[loop] = CapacityLimiter(IMAGESET_DB_THREADPOOL_SIZE)
+    return limiter
+
+
+async def run_sync(func, *args, **kwargs):
+    return await to_thread.run_sync(functools.partial(func, *args, **kwargs),
+                                    limiter=_get_limiter())
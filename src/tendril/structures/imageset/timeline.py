@@ -0,0 +1,78 @@
+
+
+"""
+ImageSet Playback Timeline
+==========================
+
+An imageset plays as a loop, with each item shown for its own duration or
+the imageset's default duration. :class:`ImageSetTimeline` precomputes the
+cumulative start offset of each item so that the item showing at any time
+into the loop can be found with a binary search.
+
+Timelines are cached per imageset version. Every change to an imageset
+bumps its version, so stale timelines are never served and simply age out
+of the cache.
+
+"""
+
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+from tendril.db.controllers.imageset import imageset_get_schedule
+from tendril.structures.imageset.cache import LRUCache
+from tendril.utils.db import with_db
+
+
+class ImageSetTimeline(object):
+    def __init__(self, items, default_duration):
+        # items is an iterable of (position, storedfile_id, duration) in
+        # playback order.
+        self.positions = array('q')
+        self.storedfile_ids = array('q')
+        self.durations = array('q')
+        for position, storedfile_id, duration in items:
+            self.positions.append(position)
+            self.storedfile_ids.append(storedfile_id)
+            self.durations.append(duration or default_duration)
+        self.offsets = array('q')
+        if len(self.durations):
+            self.offsets.append(0)
+            self.offsets.extend(accumulate(self.durations[:-1]))
+        self.total_duration = sum(self.durations)
+
+    def at(self, t):
+        """
+        Return the item showing at ``t`` seconds into the loop, along with
+        its start offset and the time remaining before the next item. ``t``
+        may be any number of seconds, such as a wall-clock timestamp, and
+        is wrapped around the loop duration.
+        """
+        if not self.total_duration:
+            return None
+        t = t % self.total_duration
+        idx = bisect_right(self.offsets, t) - 1
+        return {'index': idx,
+                'position': self.positions[idx],
+                'storedfile_id': self.storedfile_ids[idx],
+                'start': self.offsets[idx],
+                'remaining': self.offsets[idx] + self.durations[idx] - t}
+
+    def export(self):
+        return {'total_duration': self.total_duration,
+                'positions': self.positions.tolist(),
+                'offsets': self.offsets.tolist(),
+                'durations': self.durations.tolist()}
+
+
+_timelines = LRUCache(maxsize=1024)
+
+
+@with_db
+def get_timeline(id, version, session=None):
+    timeline = _timelines.get((id, version))
+    if timeline is None:
+        default_duration, items = imageset_get_schedule(id, session=session)
+        timeline = ImageSetTimeline(items, default_duration)
+        _timelines.set((id, version), timeline)
+    return timeline
@@ -0,0 +1,109 @@
+
+
+"""
+ImageSet Upload Processing Queue
+================================
+
+Processing an upload parses the file, sends it to the filestore and links
+it into the imageset. :class:`UploadQueue` runs this work on a fixed number
+of dedicated worker threads, outside the request path, with a bounded
+backlog. A surge of uploads then waits in the queue instead of competing
+with every other request for the server's workers, and once the backlog is
+full, new uploads are refused with :class:`UploadQueueFull` so that the
+client can retry later.
+
+"""
+
+import math
+import time
+import queue
+import threading
+
+from tendril.config import IMAGESET_UPLOAD_WORKERS
+from tendril.config import IMAGESET_UPLOAD_QUEUE_DEPTH
+
+from tendril.utils import log
+logger = log.get_logger(__name__, log.DEFAULT)
+
+
+class UploadQueueFull(Exception):
+    def __init__(self, depth, retry_after):
+        self.depth = depth
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return f"The imageset upload queue is full, with {self.depth} uploads " \
+               f"waiting. Retry after {self.retry_after} seconds."
+
+
+class UploadQueue(object):
+    def __init__(self, workers=IMAGESET_UPLOAD_WORKERS,
+                 maxsize=IMAGESET_UPLOAD_QUEUE_DEPTH):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        # Moving average of the time taken to process an upload, used to
+        # estimate how long a client should wait before retrying.
+        self._service_time = 1.0
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    @property
+    def retry_after(self):
+        return max(1, math.ceil(self.depth * self._service_time / self.workers))
+
+    def _start(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, daemon=True,
+                                          name=f'imageset-upload-{len(self._threads)}')
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            enqueued_at, func, args, kwargs, on_start = self._queue.get()
+            started_at = time.monotonic()
+            try:
+                if on_start:
+                    on_start(started_at - enqueued_at)
+                func(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"Exception while processing imageset upload : {e}")
+            finally:
+                elapsed = time.monotonic() - started_at
+                self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+                self._queue.task_done()
+
+    def submit(self, func, *args, on_start=None, **kwargs):
+        """
+        Queue ``func`` to be called with the provided arguments on one of
+        the workers. ``on_start``, if provided, is called with the time in
+        seconds the job waited in the queue, just before it is run.
+
+        Returns the number of jobs waiting, including this one. Raises
+        :class:`UploadQueueFull` if the backlog is already at its limit.
+        """
+        if len(self._threads) < self.workers:
+            self._start()
+        try:
+            self._queue.put_nowait((time.monotonic(), func, args, kwargs, on_start))
+        except queue.Full:
+            raise UploadQueueFull(self.depth, self.retry_after)
+        return self.depth
+
+
+_upload_queue = None
+_upload_queue_lock = threading.Lock()
+
+
+def get_upload_queue():
+    global _upload_queue
+    if _upload_queue is None:
+        with _upload_queue_lock:
+            if _upload_queue is None:
+                _upload_queue = UploadQueue()
+    return _upload_queue
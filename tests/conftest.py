@@ -0,0 +1,32 @@
+
+
+import pytest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.dialects.postgresql import JSONB
+
+from tendril.utils.db import DeclBase
+from tendril.filestore.db.model import StoredFileModel  # noqa: F401
+from tendril.filestore.db.model import FilestoreBucketModel  # noqa: F401
+from tendril.db.models import imageset  # noqa: F401
+
+
+@compiles(JSONB, 'sqlite')
+def _compile_jsonb_sqlite(type_, compiler, **kw):
+    return 'JSON'
+
+
+@pytest.fixture
+def session():
+    # A throwaway in-memory SQLite database with the schema of the models
+    # imported above. Foreign keys are not enforced, so imageset contents
+    # can refer to storedfile ids without creating the storedfiles.
+    engine = create_engine('sqlite://', poolclass=StaticPool,
+                           connect_args={'check_same_thread': False})
+    DeclBase.metadata.create_all(engine)
+    with Session(bind=engine) as session:
+        yield session
+    engine.dispose()
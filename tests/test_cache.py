@@ -0,0 +1,80 @@
+
+
+from tendril.structures.imageset import cache
+from tendril.structures.imageset.cache import LRUCache
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_and_set():
+    c = LRUCache(maxsize=4)
+    assert c.get('a') is None
+    assert c.get('a', default=0) == 0
+    c.set('a', 1)
+    assert c.get('a') == 1
+    c.set('a', 2)
+    assert c.get('a') == 2
+
+
+def test_evicts_least_recently_used():
+    c = LRUCache(maxsize=3)
+    for key in 'abc':
+        c.set(key, key)
+    # Touch 'a', so 'b' is now the least recently used.
+    assert c.get('a') == 'a'
+    c.set('d', 'd')
+    assert c.get('b') is None
+    assert [c.get(k) for k in 'acd'] == ['a', 'c', 'd']
+
+
+def test_set_refreshes_recency():
+    c = LRUCache(maxsize=2)
+    c.set('a', 1)
+    c.set('b', 2)
+    c.set('a', 3)
+    c.set('c', 4)
+    assert c.get('b') is None
+    assert c.get('a') == 3
+
+
+def test_ttl_expiry(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache.time, 'monotonic', clock)
+    c = LRUCache(maxsize=4, ttl=30)
+    c.set('a', 1)
+    clock.now += 29
+    assert c.get('a') == 1
+    clock.now += 2
+    assert c.get('a') is None
+    assert 'a' not in c._data
+
+
+def test_no_ttl_never_expires(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache.time, 'monotonic', clock)
+    c = LRUCache(maxsize=4)
+    c.set('a', 1)
+    clock.now += 10 ** 9
+    assert c.get('a') == 1
+
+
+def test_invalidation():
+    c = LRUCache(maxsize=8)
+    for interest in (1, 2):
+        for user in ('x', 'y'):
+            c.set((interest, user), True)
+    c.invalidate((1, 'x'))
+    c.invalidate((1, 'missing'))
+    assert c.get((1, 'x')) is None
+    c.invalidate_where(lambda key: key[0] == 2)
+    assert c.get((2, 'x')) is None
+    assert c.get((2, 'y')) is None
+    assert c.get((1, 'y')) is True
+    c.clear()
+    assert c.get((1, 'y')) is None
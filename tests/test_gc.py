@@ -0,0 +1,132 @@
+
+
+import asyncio
+import contextlib
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+
+from tendril.filestore import buckets
+from tendril.filestore.remote import FilestoreBucketRemote
+from tendril.filestore.db.model import StoredFileModel
+from tendril.filestore.db.model import FilestoreBucketModel
+from tendril.db.controllers.imageset import create_imageset
+from tendril.db.controllers.imageset import imageset_add_content
+from tendril.structures.imageset import gc
+
+
+class _LocalBucket:
+    def __init__(self, name):
+        self.name = name
+        self.deleted = []
+
+    def delete(self, filename, user):
+        self.deleted.append(filename)
+
+
+@pytest.fixture
+def local(monkeypatch):
+    bucket = _LocalBucket('gc-local')
+    monkeypatch.setitem(buckets._available_buckets, bucket.name, bucket)
+    return bucket
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    bucket = FilestoreBucketRemote('http://filestore', 'gc-remote')
+    monkeypatch.setitem(buckets._available_buckets, bucket.name, bucket)
+    return bucket
+
+
+@pytest.fixture(autouse=True)
+def gc_session(session, monkeypatch):
+    @contextlib.contextmanager
+    def _get_session():
+        yield session
+    monkeypatch.setattr(gc, 'get_session', _get_session)
+    return session
+
+
+def _storedfile(session, bucket_name, age=7200, size=100):
+    bucket = session.query(FilestoreBucketModel).filter_by(name=bucket_name).one_or_none()
+    if bucket is None:
+        bucket = FilestoreBucketModel(name=bucket_name)
+    storedfile = StoredFileModel(filename=f'{bucket_name}/{session.query(StoredFileModel).count()}.png',
+                                 label='imageset', interest_id=None, user_id=1,
+                                 fileinfo={'props': {'size': size}}, bucket=bucket,
+                                 created_at=datetime.utcnow() - timedelta(seconds=age))
+    session.add(storedfile)
+    session.flush()
+    return storedfile
+
+
+def _collect(**kwargs):
+    kwargs.setdefault('rate_limit', 0)
+    return asyncio.run(gc.collect_storedfiles(**kwargs))
+
+
+def test_collects_across_batches(session, local):
+    files = [_storedfile(session, local.name) for _ in range(5)]
+    report = _collect(batch_size=2)
+    assert report['candidates'] == 5
+    assert report['deleted'] == 5
+    assert report['bytes_reclaimed'] == 500
+    assert sorted(local.deleted) == sorted(x.filename for x in files)
+
+
+def test_leaves_referenced_files(session, local):
+    kept, orphan = _storedfile(session, local.name), _storedfile(session, local.name)
+    imageset = create_imageset(session=session)
+    imageset_add_content(imageset.id, kept.id, media={}, session=session)
+    report = _collect()
+    assert report['deleted'] == 1
+    assert local.deleted == [orphan.filename]
+
+
+def test_dry_run_deletes_nothing(session, local):
+    for _ in range(3):
+        _storedfile(session, local.name, size=10)
+    report = _collect(dry_run=True, batch_size=2)
+    assert report['dry_run']
+    assert report['candidates'] == 3
+    assert report['deleted'] == 0
+    assert report['bytes_reclaimed'] == 30
+    assert local.deleted == []
+
+
+def test_grace_period(session, local):
+    old = _storedfile(session, local.name, age=7200)
+    _storedfile(session, local.name, age=60)
+    report = _collect(min_age=3600)
+    assert report['candidates'] == 1
+    assert local.deleted == [old.filename]
+
+
+def test_explicit_files_ignore_grace_period(session, local):
+    recent = _storedfile(session, local.name, age=0)
+    _storedfile(session, local.name, age=7200)
+    report = _collect(storedfile_ids=[recent.id], min_age=None)
+    assert report['deleted'] == 1
+    assert local.deleted == [recent.filename]
+
+
+def test_skips_remote_buckets_with_one_warning(session, local, remote, caplog):
+    for _ in range(3):
+        _storedfile(session, remote.name)
+    kept = _storedfile(session, local.name)
+    report = _collect(batch_size=2)
+    assert report['candidates'] == 4
+    assert report['skipped'] == 3
+    assert report['failed'] == 0
+    assert report['deleted'] == 1
+    assert local.deleted == [kept.filename]
+    warnings = [x for x in caplog.records if remote.name in x.getMessage()]
+    assert len(warnings) == 1
+
+
+def test_skips_unavailable_buckets(session, local):
+    _storedfile(session, 'gc-elsewhere')
+    report = _collect()
+    assert report['skipped'] == 1
+    assert report['failed'] == 0
@@ -0,0 +1,380 @@
+
+
+import uuid
+import pytest
+
+from sqlalchemy.dialects import postgresql
+
+from tendril.db.controllers.imageset import create_imageset
+from tendril.db.controllers.imageset import get_imageset
+from tendril.db.controllers.imageset import imageset_add_content
+from tendril.db.controllers.imageset import imageset_remove_contents
+from tendril.db.controllers.imageset import imageset_heal_positions
+from tendril.db.controllers.imageset import imageset_positions
+from tendril.db.controllers.imageset import imageset_get_contents_bulk
+from tendril.db.controllers.imageset import imageset_clone
+from tendril.db.controllers.imageset import imageset_set_durations
+from tendril.db.controllers.imageset import imageset_set_all_durations
+from tendril.db.controllers.imageset import imageset_scale_durations
+from tendril.db.controllers.imageset import imageset_claim_version
+from tendril.db.controllers.imageset import imageset_refresh_summary
+from tendril.db.controllers.imageset import imageset_get_revisions
+from tendril.db.controllers.imageset import imageset_create_revision
+from tendril.db.controllers.imageset import imageset_prune_revisions
+from tendril.db.controllers.imageset import imageset_restore_revision
+from tendril.db.controllers.imageset import imageset_get_available
+from tendril.db.controllers.imageset import imageset_orphaned_storedfiles
+from tendril.db.models.imageset import ImageSetAssociationModel
+from tendril.db.models.imageset import ImageSetRevisionItemModel
+from tendril.filestore.db.model import StoredFileModel
+from tendril.filestore.db.model import FilestoreBucketModel
+from tendril.db.models.interests import InterestModel
+from tendril.common.states import LifecycleStatus
+from tendril.config import IMAGESET_UPLOAD_FILESTORE_BUCKET
+from tendril.config import IMAGESET_PUBLISHING_FILESTORE_BUCKET
+
+
+def _contents(session, id):
+    q = session.query(ImageSetAssociationModel.position,
+                      ImageSetAssociationModel.storedfile_id)
+    q = q.filter(ImageSetAssociationModel.imageset_id == id)
+    return [tuple(x) for x in q.order_by(ImageSetAssociationModel.position)]
+
+
+def _durations(session, id):
+    q = session.query(ImageSetAssociationModel.duration)
+    q = q.filter(ImageSetAssociationModel.imageset_id == id)
+    return [x for x, in q.order_by(ImageSetAssociationModel.position)]
+
+
+def _bucket(session, name):
+    bucket = session.query(FilestoreBucketModel).filter_by(name=name).one_or_none()
+    if bucket is None:
+        bucket = FilestoreBucketModel(name=name)
+        session.add(bucket)
+    return bucket
+
+
+def _storedfile(session, bucket, interest_id=1, label='imageset', user_id=1):
+    storedfile = StoredFileModel(filename=f'{interest_id}/{uuid.uuid4()}.png', label=label,
+                                 interest_id=interest_id, user_id=user_id,
+                                 bucket=_bucket(session, bucket))
+    session.add(storedfile)
+    session.flush()
+    return storedfile.id
+
+
+def _interest(session, status=LifecycleStatus.NEW):
+    interest = InterestModel(name=f'interest-{status.name}', status=status)
+    session.add(interest)
+    session.flush()
+    return interest.id
+
+
+def _imageset(session, *storedfile_ids):
+    imageset = create_imageset(session=session)
+    for storedfile_id in storedfile_ids:
+        imageset_add_content(imageset.id, storedfile_id, media={}, session=session)
+    return imageset.id
+
+
+def test_add_content_appends(session):
+    id = _imageset(session, 11, 12, 13)
+    assert _contents(session, id) == [(0, 11), (1, 12), (2, 13)]
+    assert get_imageset(id, session=session).item_count == 3
+
+
+def test_insert_at_start(session):
+    id = _imageset(session, 11, 12, 13)
+    imageset_add_content(id, 20, position=0, media={}, session=session)
+    assert _contents(session, id) == [(0, 20), (1, 11), (2, 12), (3, 13)]
+
+
+def test_insert_in_middle(session):
+    id = _imageset(session, 11, 12, 13)
+    imageset_add_content(id, 20, position=1, media={}, session=session)
+    imageset_add_content(id, 21, position=3, media={}, session=session)
+    assert _contents(session, id) == [(0, 11), (1, 20), (2, 12), (3, 21), (4, 13)]
+    assert get_imageset(id, session=session).item_count == 5
+
+
+def test_insert_at_end_position(session):
+    id = _imageset(session, 11, 12)
+    imageset_add_content(id, 20, position=2, media={}, session=session)
+    assert _contents(session, id) == [(0, 11), (1, 12), (2, 20)]
+
+
+def test_insert_does_not_shift_other_imagesets(session):
+    first = _imageset(session, 11, 12)
+    second = _imageset(session, 31, 32)
+    imageset_add_content(first, 20, position=0, media={}, session=session)
+    assert _contents(session, second) == [(0, 31), (1, 32)]
+
+
+def test_heal_closes_gaps(session):
+    id = _imageset(session, 11, 12, 13, 14, 15, 16)
+    assert imageset_remove_contents(id, positions=[0, 2, 3], session=session) == [11, 13, 14]
+    imageset_heal_positions(id, session=session)
+    assert _contents(session, id) == [(0, 12), (1, 15), (2, 16)]
+    assert get_imageset(id, session=session).item_count == 3
+
+
+def test_heal_keeps_order_when_targets_overlap(session):
+    id = _imageset(session, 11, 12, 13, 14, 15)
+    imageset_remove_contents(id, positions=[0], session=session)
+    imageset_heal_positions(id, session=session)
+    assert _contents(session, id) == [(0, 12), (1, 13), (2, 14), (3, 15)]
+
+
+def test_heal_contiguous_is_noop(session):
+    id = _imageset(session, 11, 12, 13)
+    imageset_heal_positions(id, session=session)
+    assert _contents(session, id) == [(0, 11), (1, 12), (2, 13)]
+
+
+def test_heal_leaves_other_imagesets(session):
+    first = _imageset(session, 11, 12, 13)
+    second = _imageset(session, 31, 32, 33)
+    imageset_remove_contents(second, positions=[1], session=session)
+    imageset_remove_contents(first, positions=[0], session=session)
+    imageset_heal_positions(first, session=session)
+    assert _contents(session, first) == [(0, 12), (1, 13)]
+    assert _contents(session, second) == [(0, 31), (2, 33)]
+
+
+def test_positions_after_removal(session):
+    id = _imageset(session, 11, 12, 13, 14)
+    imageset_remove_contents(id, positions=[1], session=session)
+    assert imageset_positions(id, session=session) == [0, 2, 3]
+    assert imageset_positions(_imageset(session), session=session) == []
+
+
+def test_get_contents_bulk(session):
+    first = _imageset(session, 11, 12)
+    second = _imageset(session, 31, 32, 33)
+    imageset_add_content(first, 20, position=0, media={}, session=session)
+    empty = _imageset(session)
+    rv = imageset_get_contents_bulk([first, second, empty], session=session)
+    assert [x.storedfile_id for x in rv[first]] == [20, 11, 12]
+    assert [x.position for x in rv[second]] == [0, 1, 2]
+    assert rv[empty] == []
+
+
+def test_clone_replaces_target_contents(session):
+    source = _imageset(session, 11, 12, 13)
+    target = _imageset(session, 31)
+    get_imageset(source, session=session).default_duration = 7
+    imageset_clone(source, target, session=session)
+    assert _contents(session, target) == [(0, 11), (1, 12), (2, 13)]
+    assert _contents(session, source) == [(0, 11), (1, 12), (2, 13)]
+    target = get_imageset(target, session=session)
+    assert target.default_duration == 7
+    assert target.item_count == 3
+
+
+def test_clone_into_itself_is_rejected(session):
+    id = _imageset(session, 11, 12)
+    with pytest.raises(ValueError):
+        imageset_clone(id, id, session=session)
+    assert _contents(session, id) == [(0, 11), (1, 12)]
+
+
+class _RecordingSession(object):
+    # UPDATE ... FROM VALUES is not supported by SQLite, so the statement
+    # is only compiled for Postgres.
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, stmt, *args, **kwargs):
+        self.statements.append(stmt)
+        return type('Result', (), {'rowcount': 0})()
+
+    def flush(self):
+        pass
+
+
+def test_set_durations_casts_null_durations():
+    session = _RecordingSession()
+    imageset_set_durations(1, {0: None, 1: None}, session=session)
+    sql = str(session.statements[0].compile(dialect=postgresql.dialect()))
+    assert 'SET duration=CAST(new_durations.duration AS INTEGER)' in sql
+
+
+def test_set_durations_rejects_unknown_key():
+    with pytest.raises(ValueError):
+        imageset_set_durations(1, {0: 5}, by='name', session=_RecordingSession())
+
+
+def test_set_durations_empty_is_noop():
+    session = _RecordingSession()
+    assert imageset_set_durations(1, {}, session=session) == 0
+    assert session.statements == []
+
+
+def test_set_all_durations(session):
+    id = _imageset(session, 11, 12, 13)
+    assert imageset_set_all_durations(id, 4, session=session) == 3
+    assert _durations(session, id) == [4, 4, 4]
+    assert get_imageset(id, session=session).total_duration == 12
+    imageset_set_all_durations(id, None, session=session)
+    assert _durations(session, id) == [None, None, None]
+    assert get_imageset(id, session=session).total_duration == 30
+
+
+def test_scale_durations(session):
+    id = _imageset(session, 11, 12, 13)
+    other = _imageset(session, 31)
+    imageset_set_all_durations(id, 4, session=session)
+    imageset_set_all_durations(other, 8, session=session)
+    imageset_scale_durations(id, 0.5, session=session)
+    assert _durations(session, id) == [2, 2, 2]
+    assert _durations(session, other) == [8]
+    # Durations never drop below a second, and unset durations scale the
+    # imageset default.
+    imageset_scale_durations(id, 0.1, session=session)
+    assert _durations(session, id) == [1, 1, 1]
+    imageset_set_all_durations(id, None, session=session)
+    imageset_scale_durations(id, 1.5, session=session)
+    assert _durations(session, id) == [15, 15, 15]
+
+
+def test_claim_version(session):
+    id = _imageset(session)
+    assert imageset_claim_version(id, session=session) == 1
+    assert imageset_claim_version(id, expected=1, session=session) == 2
+    assert imageset_claim_version(id, expected=1, session=session) is None
+    assert imageset_claim_version(id, session=session) == 3
+
+
+def test_claim_version_unknown_imageset(session):
+    assert imageset_claim_version(1000, session=session) is None
+
+
+def test_summary_tracks_contents(session):
+    id = _imageset(session, 11, 12, 13)
+    imageset = get_imageset(id, session=session)
+    assert (imageset.item_count, imageset.total_duration) == (3, 30)
+    imageset_add_content(id, 14, duration=5, media={}, session=session)
+    assert (imageset.item_count, imageset.total_duration) == (4, 35)
+    imageset_remove_contents(id, positions=[0, 1], session=session)
+    assert (imageset.item_count, imageset.total_duration) == (2, 15)
+    imageset_remove_contents(id, start=0, session=session)
+    assert (imageset.item_count, imageset.total_duration) == (0, 0)
+
+
+def test_summary_all_published(session):
+    published = _storedfile(session, IMAGESET_PUBLISHING_FILESTORE_BUCKET)
+    unpublished = _storedfile(session, IMAGESET_UPLOAD_FILESTORE_BUCKET)
+    first = _imageset(session, published)
+    second = _imageset(session, published, unpublished)
+    assert get_imageset(first, session=session).all_published
+    assert not get_imageset(second, session=session).all_published
+    assert get_imageset(_imageset(session), session=session).all_published
+
+
+def test_summary_refresh_by_storedfile(session):
+    storedfile_id = _storedfile(session, IMAGESET_UPLOAD_FILESTORE_BUCKET)
+    first = _imageset(session, storedfile_id)
+    second = _imageset(session, storedfile_id)
+    untouched = _imageset(session, _storedfile(session, IMAGESET_UPLOAD_FILESTORE_BUCKET))
+    session.get(StoredFileModel, storedfile_id).bucket = \
+        _bucket(session, IMAGESET_PUBLISHING_FILESTORE_BUCKET)
+    session.flush()
+    imageset_refresh_summary(storedfile_ids=[storedfile_id], session=session)
+    assert get_imageset(first, session=session).all_published
+    assert get_imageset(second, session=session).all_published
+    assert not get_imageset(untouched, session=session).all_published
+
+
+def test_summary_refresh_needs_target(session):
+    with pytest.raises(ValueError):
+        imageset_refresh_summary(session=session)
+
+
+def test_revision_reused_while_unchanged(session):
+    id = _imageset(session, 11, 12)
+    first = imageset_create_revision(id, comment='first', session=session)
+    assert imageset_create_revision(id, session=session).id == first.id
+    imageset_claim_version(id, session=session)
+    assert imageset_create_revision(id, session=session).id != first.id
+
+
+def test_revision_restore(session):
+    id = _imageset(session, 11, 12, 13)
+    imageset_set_all_durations(id, 4, session=session)
+    revision = imageset_create_revision(id, session=session)
+    imageset_claim_version(id, session=session)
+    imageset_remove_contents(id, positions=[0, 1], session=session)
+    imageset_add_content(id, 20, media={}, session=session)
+    get_imageset(id, session=session).default_duration = 5
+
+    imageset_restore_revision(id, revision.id, session=session)
+    assert _contents(session, id) == [(0, 11), (1, 12), (2, 13)]
+    assert _durations(session, id) == [4, 4, 4]
+    imageset = get_imageset(id, session=session)
+    assert (imageset.default_duration, imageset.item_count) == (10, 3)
+
+
+def test_revision_restore_other_imageset(session):
+    revision = imageset_create_revision(_imageset(session, 11), session=session)
+    id = _imageset(session, 12)
+    with pytest.raises(ValueError):
+        imageset_restore_revision(id, revision.id, session=session)
+    assert _contents(session, id) == [(0, 12)]
+
+
+def test_revision_prune(session):
+    id = _imageset(session, 11)
+    other = imageset_create_revision(_imageset(session, 31), session=session)
+    revisions = []
+    for _ in range(3):
+        imageset_claim_version(id, session=session)
+        revisions.append(imageset_create_revision(id, session=session).id)
+    assert imageset_prune_revisions(id, keep=1, session=session) == 2
+    assert [x.id for x in imageset_get_revisions(id, session=session)] == revisions[-1:]
+    assert [x.id for x in imageset_get_revisions(other.imageset_id, session=session)] == [other.id]
+    assert imageset_prune_revisions(id, keep=1, session=session) == 0
+    items = session.query(ImageSetRevisionItemModel.revision_id).distinct()
+    assert sorted(x for x, in items) == sorted([other.id, revisions[-1]])
+
+
+def test_available_lists_interest_files(session):
+    interest_id = _interest(session)
+    files = [_storedfile(session, IMAGESET_UPLOAD_FILESTORE_BUCKET, interest_id=interest_id)
+             for _ in range(3)]
+    _storedfile(session, IMAGESET_UPLOAD_FILESTORE_BUCKET, interest_id=interest_id, label='other')
+    _storedfile(session, IMAGESET_UPLOAD_FILESTORE_BUCKET, interest_id=_interest(session))
+    id = _imageset(session, files[1])
+
+    rows, total_count = imageset_get_available(id, interest_id, session=session)
+    assert total_count == 3
+    assert [(x.id, in_set) for x, in_set in rows] == \
+        [(files[0], False), (files[1], True), (files[2], False)]
+
+
+def test_available_windows(session):
+    interest_id = _interest(session)
+    files = [_storedfile(session, IMAGESET_UPLOAD_FILESTORE_BUCKET, interest_id=interest_id)
+             for _ in range(5)]
+    id = _imageset(session)
+    rows, total_count = imageset_get_available(id, interest_id, limit=2, session=session)
+    assert [x.id for x, _ in rows] == files[:2]
+    rows, total_count = imageset_get_available(id, interest_id, after=files[1], limit=2,
+                                               session=session)
+    assert [x.id for x, _ in rows] == files[2:4]
+    rows, total_count = imageset_get_available(id, interest_id, offset=4, session=session)
+    assert [x.id for x, _ in rows] == files[4:]
+    assert total_count == 5
+
+
+def test_orphans_exclude_library(session):
+    live = _interest(session, LifecycleStatus.ACTIVE)
+    closed = _interest(session, LifecycleStatus.CLOSED)
+    in_set = _storedfile(session, IMAGESET_UPLOAD_FILESTORE_BUCKET, interest_id=live)
+    _imageset(session, in_set)
+    library = _storedfile(session, IMAGESET_UPLOAD_FILESTORE_BUCKET, interest_id=live)
+    orphan = _storedfile(session, IMAGESET_UPLOAD_FILESTORE_BUCKET, interest_id=closed)
+
+    assert [x.id for x in imageset_orphaned_storedfiles(session=session)] == [library, orphan]
+    orphans = imageset_orphaned_storedfiles(exclude_states=[LifecycleStatus.ACTIVE], session=session)
+    assert [x.id for x in orphans] == [orphan]
@@ -0,0 +1,134 @@
+
+
+import io
+import struct
+
+from tendril.structures.imageset.sniff import sniff
+from tendril.structures.imageset.sniff import sniff_head
+from tendril.structures.imageset.sniff import normalize_extension
+from tendril.structures.imageset.sniff import multipart_boundary
+from tendril.structures.imageset.sniff import MultipartFileHead
+
+
+def _png(width, height):
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + \
+        struct.pack('>II', width, height) + b'\x08\x06\x00\x00\x00'
+
+
+def _jpeg(width, height):
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00' + b'\x00' * 9
+    sof0 = b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, height, width, 1) + b'\x01\x11\x00'
+    return b'\xff\xd8' + app0 + sof0 + b'\xff\xd9'
+
+
+def _multipart(boundary, filename, content, fields=()):
+    body = b''
+    for name, value in fields:
+        body += b'--' + boundary + b'\r\n'
+        body += f'Content-Disposition: form-data; name="{name}"\r\n\r\n'.encode()
+        body += value + b'\r\n'
+    body += b'--' + boundary + b'\r\n'
+    body += f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'.encode()
+    body += b'Content-Type: application/octet-stream\r\n\r\n'
+    body += content + b'\r\n--' + boundary + b'--\r\n'
+    return body
+
+
+def _feed_in_chunks(parser, body, size):
+    chunks = [body[i:i + size] for i in range(0, len(body), size)]
+    for idx, chunk in enumerate(chunks):
+        if parser.feed(chunk, more_body=idx < len(chunks) - 1):
+            break
+    return parser
+
+
+def test_sniff_png_dimensions():
+    assert sniff_head(_png(640, 480)) == {'ext': '.png', 'width': 640, 'height': 480}
+
+
+def test_sniff_jpeg_dimensions():
+    assert sniff_head(_jpeg(1920, 1080)) == {'ext': '.jpg', 'width': 1920, 'height': 1080}
+
+
+def test_sniff_pdf_without_dimensions():
+    assert sniff_head(b'%PDF-1.7\n') == {'ext': '.pdf', 'width': None, 'height': None}
+
+
+def test_sniff_unknown_type():
+    assert sniff_head(b'GIF89a')['ext'] is None
+
+
+def test_sniff_truncated_png_header():
+    assert sniff_head(_png(640, 480)[:20]) == {'ext': '.png', 'width': None, 'height': None}
+
+
+def test_sniff_restores_file_position():
+    fileobj = io.BytesIO(b'prefix' + _png(32, 16))
+    fileobj.seek(6)
+    assert sniff(fileobj)['width'] == 32
+    assert fileobj.tell() == 6
+
+
+def test_normalize_extension():
+    assert normalize_extension('.JPEG') == '.jpg'
+    assert normalize_extension('.Png') == '.png'
+
+
+def test_multipart_boundary():
+    assert multipart_boundary('multipart/form-data; boundary=abc123') == b'abc123'
+    assert multipart_boundary('multipart/form-data; boundary="a b"') == b'a b'
+    assert multipart_boundary('application/json') is None
+    assert multipart_boundary('multipart/form-data') is None
+    assert multipart_boundary(None) is None
+
+
+def test_multipart_head_single_chunk():
+    content = _png(100, 50) + b'\x00' * 64
+    body = _multipart(b'xyz', 'image.png', content, fields=[('duration', b'5')])
+    parser = MultipartFileHead(b'xyz')
+    assert parser.feed(body, more_body=False)
+    assert parser.filename == 'image.png'
+    assert parser.head == content
+
+
+def test_multipart_head_split_chunks():
+    content = _jpeg(800, 600) + b'\x00' * 1000
+    body = _multipart(b'----boundary', 'photo.jpeg', content, fields=[('duration', b'5')])
+    for size in (1, 7, 64):
+        parser = _feed_in_chunks(MultipartFileHead(b'----boundary'), body, size)
+        assert parser.done
+        assert parser.filename == 'photo.jpeg'
+        assert parser.head == content
+
+
+def test_multipart_head_truncates_to_length():
+    content = bytes(range(256)) * 8
+    body = _multipart(b'xyz', 'a.png', content)
+    parser = _feed_in_chunks(MultipartFileHead(b'xyz', length=100), body, 30)
+    assert parser.done
+    assert parser.head == content[:100]
+
+
+def test_multipart_head_done_before_body_ends():
+    content = b'\x00' * 1000
+    body = _multipart(b'xyz', 'a.png', content)
+    parser = MultipartFileHead(b'xyz', length=100)
+    assert parser.feed(body[:400])
+    assert parser.head == content[:100]
+    assert parser.feed(body[400:])
+
+
+def test_multipart_head_without_file_part():
+    body = b'--xyz\r\nContent-Disposition: form-data; name="duration"\r\n\r\n5\r\n--xyz--\r\n'
+    parser = MultipartFileHead(b'xyz')
+    assert parser.feed(body, more_body=False)
+    assert parser.filename is None
+    assert parser.head is None
+
+
+def test_multipart_head_gives_up_on_long_preamble():
+    body = _multipart(b'xyz', 'a.png', b'data', fields=[('notes', b'x' * 64 * 1024)])
+    parser = _feed_in_chunks(MultipartFileHead(b'xyz'), body, 4096)
+    assert parser.done
+    assert parser.filename is None
+    assert parser.head is None
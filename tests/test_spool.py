@@ -0,0 +1,171 @@
+
+
+import os
+import time
+
+import anyio
+import pytest
+
+from tendril.structures.imageset import spool
+from tendril.structures.imageset.spool import ResumableUpload
+from tendril.structures.imageset.spool import SpoolOffsetMismatch
+from tendril.structures.imageset.spool import SpoolSizeExceeded
+from tendril.structures.imageset.spool import SpoolFinalized
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, 'IMAGESET_UPLOAD_SPOOL_DIR', str(tmp_path))
+    return tmp_path
+
+
+def _create(upload_id='abc', size=10):
+    return ResumableUpload.create(upload_id, interest_id=1, user_id='user',
+                                  filename='a.png', storage_filename='x/a.png', size=size)
+
+
+def _write(upload, offset, *chunks):
+    async def _stream():
+        for chunk in chunks:
+            yield chunk
+    return anyio.run(upload.write, offset, _stream())
+
+
+def test_create_and_reload():
+    _create()
+    upload = ResumableUpload('abc')
+    assert upload.exists()
+    assert upload.offset == 0
+    assert upload.meta['storage_filename'] == 'x/a.png'
+    assert not upload.complete
+
+
+def test_rejects_unsafe_upload_id():
+    with pytest.raises(ValueError):
+        ResumableUpload('../abc')
+
+
+def test_write_in_chunks():
+    upload = _create()
+    assert _write(upload, 0, b'0123', b'45') == 6
+    assert _write(upload, 6, b'6789') == 10
+    assert upload.complete
+    with upload.open() as f:
+        assert f.read() == b'0123456789'
+
+
+def test_rewrite_received_chunk():
+    upload = _create()
+    _write(upload, 0, b'012345')
+    assert _write(upload, 4, b'ab') == 6
+    with upload.open() as f:
+        assert f.read() == b'0123ab'
+
+
+def test_offset_past_received_data():
+    upload = _create()
+    _write(upload, 0, b'0123')
+    with pytest.raises(SpoolOffsetMismatch) as exc:
+        _write(upload, 6, b'67')
+    assert exc.value.expected == 4
+    assert exc.value.received == 6
+    assert upload.offset == 4
+
+
+def test_size_limit_exact():
+    upload = _create(size=4)
+    assert _write(upload, 0, b'0123') == 4
+    assert upload.complete
+
+
+def test_size_limit_exceeded():
+    upload = _create(size=4)
+    with pytest.raises(SpoolSizeExceeded):
+        _write(upload, 0, b'01', b'234')
+    # Chunks within the limit are kept, so the client can resume from them.
+    assert upload.offset == 2
+
+
+def test_size_limit_on_rewrite():
+    upload = _create(size=4)
+    _write(upload, 0, b'0123')
+    with pytest.raises(SpoolSizeExceeded):
+        _write(upload, 2, b'234')
+    assert upload.offset == 4
+
+
+def test_discard():
+    upload = _create()
+    upload.discard()
+    assert not upload.exists()
+    upload.discard()
+
+
+def test_purge_stale():
+    stale = _create('stale')
+    fresh = _create('fresh')
+    old = time.time() - 3600
+    os.utime(stale.data_path, (old, old))
+    spool.purge_stale(max_age=60)
+    assert not stale.exists()
+    assert fresh.exists()
+
+
+def test_finalize_once():
+    upload = _create(size=4)
+    _write(upload, 0, b'0123')
+    assert upload.finalize()
+    assert not ResumableUpload('abc').finalize()
+    assert ResumableUpload('abc').finalized
+
+
+def test_write_after_finalize():
+    upload = _create(size=4)
+    _write(upload, 0, b'01')
+    upload.finalize()
+    with pytest.raises(SpoolFinalized):
+        _write(upload, 2, b'23')
+    assert upload.offset == 2
+
+
+def test_reopen():
+    upload = _create(size=4)
+    _write(upload, 0, b'01')
+    upload.finalize()
+    upload.reopen()
+    assert not ResumableUpload('abc').finalized
+    assert _write(upload, 2, b'23') == 4
+    assert upload.finalize()
+
+
+def test_reopen_discarded():
+    upload = _create()
+    upload.finalize()
+    upload.discard()
+    upload.reopen()
+    assert not upload.exists()
+
+
+def test_release_keeps_sidecar():
+    upload = _create(size=4)
+    _write(upload, 0, b'0123')
+    upload.finalize()
+    upload.release()
+    upload = ResumableUpload('abc')
+    assert upload.exists()
+    assert upload.complete
+    with pytest.raises(SpoolFinalized):
+        _write(upload, 0, b'0123')
+
+
+def test_purge_released():
+    released = _create('released', size=0)
+    released.finalize()
+    released.release()
+    active = _create('active')
+    old = time.time() - 3600
+    os.utime(released.meta_path, (old, old))
+    os.utime(active.meta_path, (old, old))
+    spool.purge_stale(max_age=60)
+    assert not os.path.exists(released.meta_path)
+    assert active.exists()
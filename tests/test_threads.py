@@ -0,0 +1,30 @@
+
+
+import asyncio
+import threading
+
+from tendril.structures.imageset import threads
+
+
+def test_run_sync_runs_in_worker_thread():
+    async def _run():
+        return await threads.run_sync(threading.get_ident)
+    assert asyncio.run(_run()) != threading.get_ident()
+
+
+def test_limiter_per_event_loop():
+    async def _limiter():
+        await threads.run_sync(int)
+        return threads._get_limiter()
+
+    first = asyncio.run(_limiter())
+    second = asyncio.run(_limiter())
+    assert first is not second
+
+
+def test_limiter_reused_within_event_loop():
+    async def _limiters():
+        return threads._get_limiter(), threads._get_limiter()
+
+    first, second = asyncio.run(_limiters())
+    assert first is second
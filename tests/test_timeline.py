@@ -0,0 +1,85 @@
+
+
+import pytest
+
+from tendril.structures.imageset import timeline
+from tendril.structures.imageset.timeline import ImageSetTimeline
+
+
+ITEMS = [(0, 11, 5), (1, 12, None), (2, 13, 2), (4, 14, 3)]
+
+
+@pytest.fixture
+def loop():
+    # Durations 5, 10 (default), 2, 3 : starts at 0, 5, 15, 17 : total 20
+    return ImageSetTimeline(ITEMS, default_duration=10)
+
+
+def test_offsets(loop):
+    assert loop.export() == {'total_duration': 20,
+                             'positions': [0, 1, 2, 4],
+                             'offsets': [0, 5, 15, 17],
+                             'durations': [5, 10, 2, 3]}
+
+
+@pytest.mark.parametrize('t, index', [
+    (0, 0), (4.9, 0), (5, 1), (14, 1), (15, 2), (16.5, 2), (17, 3), (19.99, 3),
+])
+def test_at_boundaries(loop, t, index):
+    item = loop.at(t)
+    assert item['index'] == index
+    assert item['position'] == ITEMS[index][0]
+    assert item['storedfile_id'] == ITEMS[index][1]
+    assert item['start'] <= t < item['start'] + loop.durations[index]
+    assert item['remaining'] == item['start'] + loop.durations[index] - t
+
+
+def test_at_wraps_around(loop):
+    assert loop.at(20)['index'] == 0
+    assert loop.at(20 * 1000 + 16)['index'] == 2
+    assert loop.at(-1)['index'] == 3
+    assert loop.at(-1)['remaining'] == 1
+
+
+def test_at_matches_linear_scan(loop):
+    for tenths in range(0, 400):
+        t = tenths / 10
+        expected, start = None, 0
+        for idx, duration in enumerate(loop.durations):
+            if start <= t % 20 < start + duration:
+                expected = idx
+                break
+            start += duration
+        assert loop.at(t)['index'] == expected
+
+
+def test_single_item():
+    single = ImageSetTimeline([(3, 7, None)], default_duration=4)
+    assert single.at(0)['position'] == 3
+    assert single.at(9)['remaining'] == 3
+
+
+def test_empty_timeline():
+    empty = ImageSetTimeline([], default_duration=10)
+    assert empty.total_duration == 0
+    assert empty.at(100) is None
+    assert empty.export()['offsets'] == []
+
+
+def test_get_timeline_is_cached_per_version(monkeypatch):
+    calls = []
+
+    def _get_schedule(id, session=None):
+        calls.append(id)
+        return 10, ITEMS
+
+    monkeypatch.setattr(timeline, 'imageset_get_schedule', _get_schedule)
+    monkeypatch.setattr(timeline, '_timelines', timeline.LRUCache(maxsize=4))
+    session = object()
+
+    first = timeline.get_timeline(1, 1, session=session)
+    assert timeline.get_timeline(1, 1, session=session) is first
+    assert calls == [1]
+
+    assert timeline.get_timeline(1, 2, session=session) is not first
+    assert calls == [1, 1]